@@ -0,0 +1,326 @@
+"""
+Benchmark get_centerline() stages and CLI throughput on synthetic corridors.
+
+Corridors are generated with a fixed seed, so results of different commits
+can be compared. Nothing is downloaded. Run from the concave_centerline
+directory:
+
+    python -m benchmarks.bench_pipeline run before.json
+    git checkout other-commit
+    python -m benchmarks.bench_pipeline run after.json
+    python -m benchmarks.bench_pipeline compare before.json after.json
+
+Times are the fastest of --repeat runs. Peak memory is measured with
+tracemalloc in a separate run, as tracing slows down Python code, and only
+covers memory allocated through Python and numpy, not by GEOS.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+import fiona
+import numpy as np
+import scipy
+import shapely
+from shapely.geometry import mapping
+
+from benchmarks.corridors import corridor
+from label_centerlines import CenterlineStats, __version__, get_centerline
+from label_centerlines.exceptions import CenterlineError
+
+
+@click.group()
+def main():
+    """Benchmark label_centerlines on synthetic corridors."""
+
+
+@main.command()
+@click.argument("output_path")
+@click.option(
+    "--vertices",
+    type=int,
+    multiple=True,
+    help="Vertex count of corridors, can be repeated. "
+    "(default: 100, 1000, 10000, 100000)",
+)
+@click.option(
+    "--seeds",
+    type=click.IntRange(min=1),
+    help="Number of corridors per vertex count. (default: 3)",
+    default=3,
+)
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    help="Number of timed runs per corridor. (default: 3)",
+    default=3,
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    multiple=True,
+    help="Worker counts of CLI runs, can be repeated. "
+    "(default: 1 up to the number of CPUs in powers of 2)",
+)
+@click.option(
+    "--cli_features",
+    type=click.IntRange(min=0),
+    help="Number of features of CLI runs, 0 to skip them. (default: 200)",
+    default=200,
+)
+def run(output_path, vertices, seeds, repeat, workers, cli_features):
+    """Run benchmarks and write results to OUTPUT_PATH as JSON."""
+    vertices = vertices or (100, 1000, 10000, 100000)
+    workers = workers or _powers_of_two(os.cpu_count())
+    results = dict(environment=_environment(), centerlines=[], cli=[])
+    for count in vertices:
+        for seed in range(seeds):
+            name = "corridor-%s-%s" % (count, seed)
+            result = _bench_centerline(corridor(count, seed=seed), repeat)
+            results["centerlines"].append(dict(name=name, **result))
+            click.echo(
+                "%-22s %9.4fs %8.1f MB %s"
+                % (
+                    name,
+                    result["seconds"],
+                    result["peak_memory"] / 2**20,
+                    result["error"] or "",
+                )
+            )
+    if cli_features:
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "corridors.gpkg")
+            _write_corridors(input_path, cli_features, vertices)
+            for count in workers:
+                result = _bench_cli(
+                    input_path, os.path.join(tmp, "out-%s.geojson" % count), count
+                )
+                results["cli"].append(result)
+                click.echo(
+                    "cli %2s workers %9.3fs %8.1f features/s"
+                    % (count, result["seconds"], result["features_per_second"])
+                )
+    with open(output_path, "w") as dst:
+        json.dump(results, dst, indent=2)
+
+
+@main.command()
+@click.argument("base_path")
+@click.argument("new_path")
+@click.option(
+    "--threshold",
+    type=float,
+    help="Relative change reported as regression. (default: 0.1)",
+    default=0.1,
+)
+def compare(base_path, new_path, threshold):
+    """
+    Compare results of BASE_PATH and NEW_PATH.
+
+    Exits with status 1 if anything got slower or uses more memory by more
+    than threshold.
+    """
+    with open(base_path) as src:
+        base = json.load(src)
+    with open(new_path) as src:
+        new = json.load(src)
+    for results in (base, new):
+        environment = results["environment"]
+        click.echo(
+            "%s: %s (%s), %s CPUs"
+            % (
+                environment["commit"],
+                environment["label_centerlines"],
+                environment["python"],
+                environment["cpus"],
+            )
+        )
+    rows = []
+    base_centerlines = {result["name"]: result for result in base["centerlines"]}
+    for result in new["centerlines"]:
+        before = base_centerlines.get(result["name"])
+        if before is None:
+            continue
+        rows.append((result["name"], "seconds", before["seconds"], result["seconds"]))
+        rows.append(
+            (
+                result["name"],
+                "peak_memory",
+                before["peak_memory"],
+                result["peak_memory"],
+            )
+        )
+        for stage, seconds in result["stages"].items():
+            if stage in before["stages"]:
+                rows.append((result["name"], stage, before["stages"][stage], seconds))
+    base_cli = {result["workers"]: result for result in base["cli"]}
+    for result in new["cli"]:
+        before = base_cli.get(result["workers"])
+        if before is not None:
+            # compare seconds per feature, so lower is better like everything else
+            rows.append(
+                (
+                    "cli-%s-workers" % result["workers"],
+                    "seconds_per_feature",
+                    1 / before["features_per_second"],
+                    1 / result["features_per_second"],
+                )
+            )
+
+    regressions = 0
+    click.echo(
+        "%-22s %-20s %12s %12s %8s" % ("case", "metric", "base", "new", "change")
+    )
+    for name, metric, before, after in rows:
+        change = (after - before) / before if before else 0.0
+        # stage times below a millisecond are too noisy to compare
+        noisy = metric not in ("seconds", "peak_memory") and max(before, after) < 1e-3
+        flag = ""
+        if change > threshold and not noisy:
+            flag = "slower" if metric != "peak_memory" else "larger"
+            regressions += 1
+        elif change < -threshold and not noisy:
+            flag = "faster" if metric != "peak_memory" else "smaller"
+        click.echo(
+            "%-22s %-20s %12.4g %12.4g %+7.1f%% %s"
+            % (name, metric, before, after, 100 * change, flag)
+        )
+    if regressions:
+        click.echo("%s regressions above %.0f%%" % (regressions, 100 * threshold))
+        sys.exit(1)
+
+
+def _bench_centerline(geom, repeat):
+    """Return fastest time, stage times, counts and peak memory of geom."""
+    runs = []
+    error = None
+    for _ in range(repeat):
+        stats = CenterlineStats()
+        start = time.perf_counter()
+        try:
+            centerline = get_centerline(geom, stats=stats)
+        except CenterlineError as e:
+            centerline, error = None, str(e)
+        runs.append((time.perf_counter() - start, stats))
+    seconds, stats = min(runs, key=lambda run: run[0])
+
+    stage_peaks = {}
+
+    def _callback(stage, elapsed):
+        if elapsed is None:
+            tracemalloc.reset_peak()
+        else:
+            peak = tracemalloc.get_traced_memory()[1]
+            stage_peaks[stage] = max(stage_peaks.get(stage, 0), peak)
+
+    with _tracing():
+        try:
+            get_centerline(geom, stats=CenterlineStats(callback=_callback))
+        except CenterlineError:
+            pass
+        peak = max([tracemalloc.get_traced_memory()[1], *stage_peaks.values()])
+
+    return dict(
+        vertices=len(geom.exterior.coords),
+        seconds=seconds,
+        median_seconds=statistics.median(run[0] for run in runs),
+        stages=stats.stages,
+        counts=stats.counts,
+        peak_memory=peak,
+        stage_peak_memory=stage_peaks,
+        centerline_length=None if centerline is None else centerline.length,
+        error=error,
+    )
+
+
+@contextmanager
+def _tracing():
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+
+def _write_corridors(path, features, vertices):
+    """Write features corridors cycling through vertex counts to GeoPackage."""
+    with fiona.open(
+        path,
+        "w",
+        driver="GPKG",
+        schema=dict(geometry="Polygon", properties=dict(id="int")),
+    ) as dst:
+        dst.writerecords(
+            dict(
+                geometry=mapping(corridor(vertices[i % len(vertices)], seed=1000 + i)),
+                properties=dict(id=i),
+            )
+            for i in range(features)
+        )
+
+
+def _bench_cli(input_path, output_path, workers):
+    """Return wall time and throughput of a CLI run with workers."""
+    from label_centerlines.cli import main as cli
+
+    with fiona.open(input_path) as src:
+        features = len(src)
+    start = time.perf_counter()
+    cli.main(
+        [input_path, output_path, "--workers", str(workers)],
+        standalone_mode=False,
+    )
+    seconds = time.perf_counter() - start
+    return dict(
+        workers=workers,
+        features=features,
+        seconds=seconds,
+        features_per_second=features / seconds,
+    )
+
+
+def _environment():
+    """Return versions and hardware results depend on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        label_centerlines=__version__,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        numpy=np.__version__,
+        scipy=scipy.__version__,
+        shapely=shapely.__version__,
+        geos=shapely.geos_version_string,
+    )
+
+
+def _powers_of_two(limit):
+    """Return 1, 2, 4, ... up to and including limit."""
+    counts = [1]
+    while counts[-1] * 2 < limit:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != limit:
+        counts.append(limit)
+    return tuple(counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare vectorized outline segmentization against the former implementation.
+
+Run from the concave_centerline directory:
+
+    python -m benchmarks.bench_segmentize
+"""
+
+import timeit
+
+import numpy as np
+from shapely.geometry import LineString
+
+from label_centerlines._src import _segmentize
+
+
+def _segmentize_legacy(geom, max_len):
+    """Former implementation interpolating every point with shapely."""
+    points = []
+    for previous, current in zip(geom.coords, geom.coords[1:]):
+        line_segment = LineString([previous, current])
+        points.extend(
+            [
+                line_segment.interpolate(max_len * i).coords[0]
+                for i in range(int(line_segment.length / max_len))
+            ]
+        )
+        points.append(current)
+    return LineString(points)
+
+
+def _corridor(length, width=10.0, vertices=500, seed=0):
+    """Return a meandering corridor polygon of given length."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, length, vertices)
+    y = np.cumsum(rng.normal(0, length / vertices, vertices))
+    return LineString(np.column_stack([x, y])).buffer(width / 2)
+
+
+def main(lengths=(100, 1000, 5000), max_len=0.5, repeat=3):
+    print(
+        "%10s %10s %12s %12s %8s" % ("length", "points", "legacy", "vector", "speedup")
+    )
+    for length in lengths:
+        outline = _corridor(length).exterior
+        legacy = _segmentize_legacy(outline, max_len)
+        vector = _segmentize(outline, max_len)
+        assert np.array_equal(np.asarray(legacy.coords), np.asarray(vector.coords))
+        legacy_time = min(
+            timeit.repeat(
+                lambda: _segmentize_legacy(outline, max_len), number=1, repeat=repeat
+            )
+        )
+        vector_time = min(
+            timeit.repeat(
+                lambda: _segmentize(outline, max_len), number=1, repeat=repeat
+            )
+        )
+        print(
+            "%10s %10s %11.4fs %11.4fs %7.1fx"
+            % (
+                length,
+                len(vector.coords),
+                legacy_time,
+                vector_time,
+                legacy_time / vector_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
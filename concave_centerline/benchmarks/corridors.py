@@ -0,0 +1,149 @@
+"""
+Seeded generator of synthetic corridor polygons for benchmarks.
+
+Corridors follow a smooth random walk, change their width along the way and
+have side branches, like roads or rivers digitized from imagery. The same
+seed and parameters always return the same polygon, so benchmark results
+can be compared between commits.
+"""
+
+import numpy as np
+import shapely
+from shapely.geometry import LineString, Polygon
+from shapely.ops import substring
+
+
+def corridor(
+    vertices=1000,
+    length=1000.0,
+    width=(5.0, 30.0),
+    branches=3,
+    curviness=0.3,
+    roughness=0.05,
+    seed=0,
+):
+    """
+    Return corridor Polygon with approximately the given number of vertices.
+
+    Parameters:
+    -----------
+    vertices : Approximate number of vertices of the outline.
+        (default: 1000)
+    length : Length of the main axis.
+        (default: 1000.0)
+    width : Minimum and maximum width, which varies along the corridor.
+        (default: (5.0, 30.0))
+    branches : Number of side branches.
+        (default: 3)
+    curviness : Standard deviation of the change of direction in radians
+        per step of 5% of the length.
+        (default: 0.3)
+    roughness : Noise added to outline vertices relative to the minimum
+        width or the distance between vertices if smaller.
+        (default: 0.05)
+    seed : Seed of the random number generator.
+        (default: 0)
+
+    Returns:
+    --------
+    Polygon
+    """
+    rng = np.random.default_rng(seed)
+    axis = _random_walk(rng, (0.0, 0.0), 0.0, length, curviness)
+    parts = _varying_buffer(rng, axis, width)
+    for _ in range(branches):
+        # branches leave the main axis at a random point to either side
+        start = axis.interpolate(rng.uniform(0.2, 0.8), normalized=True)
+        heading = rng.choice([-1, 1]) * rng.uniform(np.pi / 6, np.pi / 2)
+        branch = _random_walk(
+            rng,
+            start.coords[0],
+            _heading_at(axis, axis.project(start)) + heading,
+            length * rng.uniform(0.1, 0.4),
+            curviness,
+        )
+        parts.extend(_varying_buffer(rng, branch, (width[0], width[1] / 2)))
+    polygon = shapely.union_all(parts)
+    if polygon.geom_type != "Polygon":
+        polygon = max(polygon.geoms, key=lambda part: part.area)
+    # drop holes where branches loop back onto the corridor
+    polygon = Polygon(polygon.exterior)
+
+    # reach the requested number of vertices by simplifying or densifying
+    count = len(polygon.exterior.coords)
+    if count > vertices:
+        polygon = _simplify_to(polygon, vertices)
+    elif count < vertices:
+        polygon = shapely.segmentize(
+            polygon, polygon.exterior.length / (vertices - count + 1)
+        )
+    coords = np.asarray(polygon.exterior.coords)
+    spacing = polygon.exterior.length / len(coords)
+    coords[:-1] += rng.normal(0, roughness * min(width[0], spacing), coords[:-1].shape)
+    coords[-1] = coords[0]
+    polygon = shapely.make_valid(Polygon(coords))
+    if polygon.geom_type != "Polygon":
+        polygon = max(shapely.get_parts(polygon), key=lambda part: shapely.area(part))
+    return polygon
+
+
+def corridors(vertices=(100, 1000, 10000, 100000), seeds=(0, 1, 2), **kwargs):
+    """Return dictionary of names and corridors for all vertices and seeds."""
+    return {
+        "corridor-%s-%s" % (count, seed): corridor(count, seed=seed, **kwargs)
+        for count in vertices
+        for seed in seeds
+    }
+
+
+def _random_walk(rng, start, heading, length, curviness, steps=20):
+    """Return smooth LineString of random direction changes."""
+    headings = heading + np.cumsum(rng.normal(0, curviness, steps))
+    step = length / steps
+    points = np.cumsum(
+        np.column_stack([np.cos(headings), np.sin(headings)]) * step, axis=0
+    )
+    points = np.vstack([[0.0, 0.0], points]) + start
+    # smooth corners by interpolating a quadratic curve through the midpoints
+    midpoints = (points[:-1] + points[1:]) / 2
+    t = np.linspace(0, 1, 8)[:, None, None]
+    curves = (
+        (1 - t) ** 2 * midpoints[:-1]
+        + 2 * (1 - t) * t * points[1:-1]
+        + t**2 * midpoints[1:]
+    )
+    return LineString(
+        np.vstack([points[:1], curves.transpose(1, 0, 2).reshape(-1, 2), points[-1:]])
+    )
+
+
+def _varying_buffer(rng, line, width, pieces=8):
+    """Return buffers of line pieces of random widths."""
+    bounds = np.linspace(0, line.length, pieces + 1)
+    return [
+        shapely.buffer(
+            substring(line, start, end),
+            rng.uniform(*width) / 2,
+            quad_segs=4,
+        )
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def _heading_at(line, distance):
+    """Return direction of line at distance in radians."""
+    x0, y0 = line.interpolate(max(distance - 1, 0)).coords[0]
+    x1, y1 = line.interpolate(min(distance + 1, line.length)).coords[0]
+    return np.arctan2(y1 - y0, x1 - x0)
+
+
+def _simplify_to(polygon, vertices):
+    """Return polygon simplified to at most about the given number of vertices."""
+    low, high = 0.0, polygon.length / 10
+    for _ in range(30):
+        tolerance = (low + high) / 2
+        if len(polygon.simplify(tolerance).exterior.coords) > vertices:
+            low = tolerance
+        else:
+            high = tolerance
+    return polygon.simplify(high)
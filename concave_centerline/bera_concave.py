@@ -1,104 +1,372 @@
-import shapely
-from shapely.geometry import mapping, shape, Polygon, MultiPolygon
+"""
+Concave hulls and centerlines of footprint polygons.
+
+Polygons are segmentized, holes removed and simplified, MultiPolygons are
+replaced by the alpha shape of all their outline points. Centerlines are
+then extracted from these hull polygons. Features are streamed through a
+process pool and both outputs are written in batches as results come in,
+so memory use does not depend on the number of features.
+
+Usage:
+
+    python bera_concave.py footprints.shp hulls.shp centerlines.shp
+"""
+
+import concurrent.futures
+from contextlib import ExitStack
+import itertools
+import logging
+import os
+
+import click
 import fiona
-import alphashape
+import shapely
+from shapely.geometry import MultiPolygon, Polygon, mapping, shape
+
 from label_centerlines import get_centerline
+from label_centerlines.exceptions import CenterlineError
+
+logger = logging.getLogger(__name__)
 
-# src_shp = r"D:\BT_Test\ConcaveHull\footprint_fixed.shp"
-# dst_shp = r"D:\BT_Test\ConcaveHull\footprint_no_holes_simp.shp"
-# line_shp = r"D:\BT_Test\ConcaveHull\centerline_no_holes_simp.shp"
-
-# src_shp = r"D:\BT_Test\ConcaveHull\test_polygons.shp"
-# dst_shp = r"D:\BT_Test\ConcaveHull\test_polygons_dst.shp"
-# line_shp = r"D:\BT_Test\ConcaveHull\test_centerline.shp"
-
-src_shp = r"D:\BT_Test\ConcaveHull\footprint_corridor.shp"
-dst_shp = r"D:\BT_Test\ConcaveHull\corridor_polygons.shp"
-line_shp = r"D:\BT_Test\ConcaveHull\corridor_centerline_smooth-2.shp"
-
-DELETE_HOLES = True
-SIMPLIFY_POLYGON = True
-
-pts_list = []
-poly_list = []
-dst_crs = None
-single_poly = []
-
-with fiona.open(src_shp) as src:
-    src_schema = src.schema
-    dst_crs = src.crs
-    for feat in src:
-        geom = shape(feat.geometry)
-        poly = shapely.segmentize(geom, max_segment_length=10)
-
-        exterior_pts = []
-        if type(poly) == MultiPolygon:
-            single_poly.append(False)
-            for i in poly.geoms:
-                exterior_pts += list(i.exterior.coords)
-        elif type(poly) == Polygon:
-            single_poly.append(True)
-            exterior_pts = list(poly.exterior.coords)
-            if DELETE_HOLES:
-                poly = Polygon(exterior_pts)
-            if SIMPLIFY_POLYGON:
-                poly = poly.simplify(1)
-
-        poly_list.append(poly)
-        pts_list.append(exterior_pts)
-
-dst_geoms = []
-
-for index, pt_list, poly in zip(enumerate(single_poly), pts_list, poly_list):
-    # alpha = alphashape.optimizealpha(i)
-    alpha = 0.05
-    i = index[0]
-    single = index[1]
-    if single:
-        alpha_shp = poly
+
+def concave_hull(
+    geom, segmentize_maxlen=10, alpha=0.05, delete_holes=True, simplification=1
+):
+    """
+    Return hull Polygon of footprint.
+
+    Parameters:
+    -----------
+    geom : Polygon or MultiPolygon
+    segmentize_maxlen : Maximum segment length of the outline.
+        (default: 10)
+    alpha : Alpha value of the alpha shape of MultiPolygons.
+        (default: 0.05)
+    delete_holes : Remove holes of Polygons.
+        (default: True)
+    simplification : Simplification tolerance of Polygons, 0 to keep all
+        vertices.
+        (default: 1)
+
+    Returns:
+    --------
+    Polygon or geometry returned by alphashape
+    """
+    poly = shapely.segmentize(geom, max_segment_length=segmentize_maxlen)
+    if isinstance(poly, MultiPolygon):
+        import alphashape
+
+        return alphashape.alphashape(
+            [point for part in poly.geoms for point in part.exterior.coords], alpha
+        )
+    elif isinstance(poly, Polygon):
+        if delete_holes:
+            poly = Polygon(poly.exterior.coords)
+        if simplification:
+            poly = poly.simplify(simplification)
+        return poly
     else:
-        alpha_shp = alphashape.alphashape(pt_list, alpha)
-
-    dst_geoms.append(alpha_shp)
-
-# use shapely concave_hull
-# alphashape has better output
-# shapely: 0.1, alphashape: 0.03
-# for i in poly_list:
-#     alpha_shp = shapely.concave_hull(i, ratio=0.1)
-#     dst_geoms.append(alpha_shp)
-
-# generate centerlines
-centerlines = []
-for i, poly in enumerate(dst_geoms):
-    line = get_centerline(poly, segmentize_maxlen=1, max_points=3000, simplification=0.05, smooth_sigma=2.5, max_paths=1)
-    centerlines.append(line)
-    print('Polygon {} done'.format(i))
-
-# Write out concave polygons
-dst_schema = {
-    'geometry': 'Polygon',
-    'properties': {},
-}
-
-with fiona.open(dst_shp, mode='w', driver='ESRI Shapefile', crs=dst_crs, schema=dst_schema) as c:
-    for poly in dst_geoms:
-        c.write({
-
-            'geometry': mapping(poly),
-            'properties': {},
-        })
-
-# Write out centerlines
-line_schema = {
-    'geometry': 'LineString',
-    'properties': {},
-}
-
-# Write a new Shapefile
-with fiona.open(line_shp, mode='w', driver='ESRI Shapefile', crs=dst_crs, schema=line_schema) as c:
-    for line in centerlines:
-        c.write({
-            'geometry': mapping(line),
-            'properties': {},
-        })
\ No newline at end of file
+        raise TypeError("invalid geometry type: %s" % poly.geom_type)
+
+
+def concave_centerlines(
+    src_path,
+    hull_path,
+    line_path,
+    segmentize_maxlen=10,
+    alpha=0.05,
+    delete_holes=True,
+    simplification=1,
+    centerline_options=None,
+    workers=None,
+    chunk_size=16,
+    max_in_flight=None,
+    batch_size=1000,
+    driver="ESRI Shapefile",
+):
+    """
+    Write hull polygons and centerlines of all features.
+
+    Results are written as they are finished, not in input order, so both
+    outputs have an "id" attribute with the index of the input feature. If
+    no centerline can be extracted from a hull, only the hull is written.
+
+    Parameters:
+    -----------
+    src_path : Path of footprint polygons.
+    hull_path : Output path of hull polygons.
+    line_path : Output path of centerlines.
+    segmentize_maxlen, alpha, delete_holes, simplification : see concave_hull()
+    centerline_options : Keyword arguments of get_centerline().
+        (default: dict(segmentize_maxlen=1, max_points=3000, simplification=0.05,
+        smooth_sigma=2.5, max_paths=1))
+    workers : Number of worker processes.
+        (default: number of CPUs)
+    chunk_size : Number of features sent to a worker at once.
+        (default: 16)
+    max_in_flight : Maximum number of chunks submitted to the workers at the
+        same time, so features are only read as fast as results are written.
+        (default: 4 times workers)
+    batch_size : Number of features written at once.
+        (default: 1000)
+    driver : OGR driver of both outputs.
+        (default: "ESRI Shapefile")
+
+    Returns:
+    --------
+    tuple : number of hulls and centerlines written
+    """
+    options = dict(
+        segmentize_maxlen=segmentize_maxlen,
+        alpha=alpha,
+        delete_holes=delete_holes,
+        simplification=simplification,
+        centerline_options=dict(
+            centerline_options
+            or dict(
+                segmentize_maxlen=1,
+                max_points=3000,
+                simplification=0.05,
+                smooth_sigma=2.5,
+                max_paths=1,
+            )
+        ),
+    )
+    workers = workers or os.cpu_count()
+    with ExitStack() as es:
+        src = es.enter_context(fiona.open(src_path))
+        hull_dst, line_dst = (
+            es.enter_context(
+                fiona.open(
+                    path,
+                    "w",
+                    driver=driver,
+                    crs=src.crs,
+                    schema=dict(geometry=geometry, properties=dict(id="int")),
+                )
+            )
+            for path, geometry in ((hull_path, "Polygon"), (line_path, "LineString"))
+        )
+        executor = es.enter_context(concurrent.futures.ProcessPoolExecutor(workers))
+
+        def _tasks():
+            features = (
+                (index, shapely.to_wkb(shape(feature["geometry"])))
+                for index, feature in enumerate(src)
+            )
+            for task in itertools.count():
+                chunk = list(itertools.islice(features, chunk_size))
+                if not chunk:
+                    break
+                yield task, (chunk, options)
+
+        hulls, lines = [], []
+        hull_count = line_count = 0
+        for _, future in _as_completed(
+            executor, _process_chunk, _tasks(), max_in_flight or 4 * workers
+        ):
+            for index, hull, line, error in future.result():
+                if error is not None:
+                    logger.error("feature %s: %s", index, error)
+                if hull is not None:
+                    hulls.append(_record(hull, index))
+                if line is not None:
+                    lines.append(_record(line, index))
+                logger.debug("feature %s done", index)
+            if len(hulls) >= batch_size:
+                hull_dst.writerecords(hulls)
+                hull_count += len(hulls)
+                hulls = []
+            if len(lines) >= batch_size:
+                line_dst.writerecords(lines)
+                line_count += len(lines)
+                lines = []
+        hull_dst.writerecords(hulls)
+        line_dst.writerecords(lines)
+        return hull_count + len(hulls), line_count + len(lines)
+
+
+def _process_chunk(chunk, options):
+    """Return index, hull and centerline WKB and error of features."""
+    return [_process_feature(index, wkb, **options) for index, wkb in chunk]
+
+
+def _process_feature(index, wkb, centerline_options=None, **kwargs):
+    try:
+        hull = concave_hull(shapely.from_wkb(wkb), **kwargs)
+    except Exception as e:
+        return index, None, None, "hull failed: %s" % e
+    # alpha shapes of distant parts can be points, lines or empty collections,
+    # which cannot be written as hulls
+    if hull.geom_type not in ("Polygon", "MultiPolygon"):
+        return index, None, None, "hull failed: alpha shape is %s" % hull.geom_type
+    try:
+        line = get_centerline(hull, **centerline_options)
+    except (CenterlineError, TypeError, ValueError) as e:
+        return index, shapely.to_wkb(hull), None, "centerline failed: %s" % e
+    return index, shapely.to_wkb(hull), shapely.to_wkb(line), None
+
+
+def _as_completed(executor, fn, tasks, max_in_flight):
+    """
+    Yield keys and futures of tasks as they are finished.
+
+    Tasks are (key, args) tuples which are only submitted to executor as long
+    as less than max_in_flight tasks are pending.
+    """
+    tasks = iter(tasks)
+    pending = {}
+
+    def _submit():
+        while len(pending) < max_in_flight:
+            try:
+                key, args = next(tasks)
+            except StopIteration:
+                return
+            pending[executor.submit(fn, *args)] = key
+
+    _submit()
+    while pending:
+        done, _ = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            key = pending.pop(future)
+            _submit()
+            yield key, future
+
+
+def _record(wkb, index):
+    return dict(geometry=mapping(shapely.from_wkb(wkb)), properties=dict(id=index))
+
+
+@click.command()
+@click.argument("src_path")
+@click.argument("hull_path")
+@click.argument("line_path")
+@click.option(
+    "--segmentize_maxlen",
+    type=float,
+    help="Maximum segment length of footprint outlines. (default: 10)",
+    default=10,
+)
+@click.option(
+    "--alpha",
+    type=float,
+    help="Alpha value of the alpha shape of MultiPolygons. (default: 0.05)",
+    default=0.05,
+)
+@click.option(
+    "--keep_holes",
+    is_flag=True,
+    help="Keep holes of Polygons.",
+)
+@click.option(
+    "--simplification",
+    type=float,
+    help="Simplification tolerance of Polygons, 0 to keep all vertices. "
+    "(default: 1)",
+    default=1,
+)
+@click.option(
+    "--centerline_segmentize_maxlen",
+    type=float,
+    help="Maximum segment length for centerline extraction. (default: 1)",
+    default=1,
+)
+@click.option(
+    "--max_points",
+    type=int,
+    help="Number of points per geometry allowed before simplifying. " "(default: 3000)",
+    default=3000,
+)
+@click.option(
+    "--centerline_simplification",
+    type=float,
+    help="Simplification threshold of centerline extraction. (default: 0.05)",
+    default=0.05,
+)
+@click.option(
+    "--smooth",
+    type=float,
+    help="Smoothness of the output centerlines. (default: 2.5)",
+    default=2.5,
+)
+@click.option(
+    "--max_paths",
+    type=int,
+    help="Number of longest paths used to create the centerlines. (default: 1)",
+    default=1,
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    help="Number of worker processes. (default: number of CPUs)",
+)
+@click.option(
+    "--chunk_size",
+    type=click.IntRange(min=1),
+    help="Number of features sent to a worker at once. (default: 16)",
+    default=16,
+)
+@click.option(
+    "--batch_size",
+    type=click.IntRange(min=1),
+    help="Number of features written at once. (default: 1000)",
+    default=1000,
+)
+@click.option(
+    "--driver",
+    help="OGR driver of both outputs. (default: 'ESRI Shapefile')",
+    default="ESRI Shapefile",
+)
+@click.option("--debug", is_flag=True, help="show debug log messages")
+def main(
+    src_path,
+    hull_path,
+    line_path,
+    segmentize_maxlen,
+    alpha,
+    keep_holes,
+    simplification,
+    centerline_segmentize_maxlen,
+    max_points,
+    centerline_simplification,
+    smooth,
+    max_paths,
+    workers,
+    chunk_size,
+    batch_size,
+    driver,
+    debug,
+):
+    """Write hull polygons and centerlines of footprints in SRC_PATH."""
+    logging.basicConfig(
+        level=logging.DEBUG if debug else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+    )
+    hulls, lines = concave_centerlines(
+        src_path,
+        hull_path,
+        line_path,
+        segmentize_maxlen=segmentize_maxlen,
+        alpha=alpha,
+        delete_holes=not keep_holes,
+        simplification=simplification,
+        centerline_options=dict(
+            segmentize_maxlen=centerline_segmentize_maxlen,
+            max_points=max_points,
+            simplification=centerline_simplification,
+            smooth_sigma=smooth,
+            max_paths=max_paths,
+        ),
+        workers=workers,
+        chunk_size=chunk_size,
+        batch_size=batch_size,
+        driver=driver,
+    )
+    logger.info("wrote %s hulls and %s centerlines", hulls, lines)
+
+
+if __name__ == "__main__":
+    main()
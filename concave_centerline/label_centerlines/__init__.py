@@ -1,6 +1,9 @@
 import logging
 
-from ._src import get_centerline
+from ._batch import CenterlineResult, get_centerlines
+from ._cache import CenterlineCache
+from ._src import CenterlineSkeleton, get_centerline
+from ._stats import CenterlineStats
 
 
 __version__ = "2022.6.0"
@@ -0,0 +1,176 @@
+from contextlib import contextmanager
+import json
+import logging
+import os
+import shapely
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _read_arrow(path, batch_size, bbox=None, where=None):
+    """
+    Open features as Arrow record batches.
+
+    GeoParquet files (*.parquet) are read with pyarrow, everything else with
+    pyogrio, which applies bbox and where while reading.
+
+    Yields:
+    -------
+    tuple : CRS as PROJJSON dictionary, "OGC:CRS84" or None, number of
+        features or None if unknown and an iterator of (feature IDs,
+        attribute RecordBatch, list of WKB geometries) tuples
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        if bbox or where:
+            raise ValueError("bbox and where are not supported for GeoParquet")
+        parquet = pq.ParquetFile(path)
+        geo = json.loads(parquet.schema_arrow.metadata[b"geo"])
+        column = geo["primary_column"]
+
+        def _batches():
+            # row numbers serve as feature IDs
+            offset = 0
+            for batch in parquet.iter_batches(batch_size=batch_size):
+                yield (
+                    [str(i) for i in range(offset, offset + batch.num_rows)],
+                    batch.drop_columns([column]),
+                    batch.column(column).to_pylist(),
+                )
+                offset += batch.num_rows
+
+        # a missing CRS means longitude and latitude in GeoParquet
+        crs = geo["columns"][column].get("crs", "OGC:CRS84")
+        yield crs, parquet.metadata.num_rows, _batches()
+
+    else:
+        import pyogrio
+        from pyogrio.raw import open_arrow
+
+        total = None if bbox or where else pyogrio.read_info(path)["features"]
+        with open_arrow(
+            path,
+            bbox=bbox,
+            where=where,
+            batch_size=batch_size,
+            return_fids=True,
+            use_pyarrow=True,
+        ) as (meta, reader):
+            column = meta["geometry_name"] or "wkb_geometry"
+            fid_column = meta["fid_column"] or "OGC_FID"
+            extension = reader.schema.field(column).metadata or {}
+            crs = json.loads(
+                extension.get(b"ARROW:extension:metadata", b"{}") or b"{}"
+            ).get("crs")
+
+            def _batches():
+                for batch in reader:
+                    yield (
+                        [str(i) for i in batch.column(fid_column).to_pylist()],
+                        batch.drop_columns([fid_column, column]),
+                        batch.column(column).to_pylist(),
+                    )
+
+            yield crs, total if total and total > 0 else None, _batches()
+
+
+def _centerline_batch(attributes, results):
+    """
+    Return RecordBatch of centerline parts and attributes of their features.
+
+    Parameters:
+    -----------
+    attributes : RecordBatch of input feature attributes
+    results : List of (row, centerline WKB or None, elapsed seconds, ...)
+        tuples
+
+    Returns:
+    --------
+    RecordBatch : attributes and a WKB "geometry" column with one
+        LineString per row
+    """
+    import pyarrow as pa
+
+    rows = [row for row, wkb, *_ in results if wkb is not None]
+    # output is split up into single part geometries like the fiona output
+    parts, part_rows = shapely.get_parts(
+        shapely.from_wkb([wkb for _, wkb, *_ in results if wkb is not None]),
+        return_index=True,
+    )
+    batch = attributes.take(pa.array([rows[i] for i in part_rows], type=pa.int64()))
+    return batch.append_column(
+        "geometry", pa.array(shapely.to_wkb(parts), type=pa.binary())
+    )
+
+
+class _ArrowSink:
+    """
+    Write centerline RecordBatches as GeoParquet or with pyogrio.
+
+    GeoParquet files are written with pyarrow, one row group per write() and
+    cannot be appended to. Other formats are written with pyogrio, which
+    appends one transaction per write().
+    """
+
+    def __init__(self, path, driver, crs=None, append=False):
+        self.path = path
+        self.driver = driver
+        self.crs = crs
+        self._append = append
+        self._parquet = None
+        if driver == "Parquet" and append:
+            raise ValueError("cannot append to GeoParquet")
+        if not append and os.path.exists(path):
+            os.remove(path)
+
+    def write(self, batches):
+        """Write list of RecordBatches and return number of rows written."""
+        import pyarrow as pa
+
+        table = pa.Table.from_batches(batches)
+        if not table.num_rows:
+            return 0
+        if self.driver == "Parquet":
+            self._write_parquet(table)
+        else:
+            from pyogrio.raw import write_arrow
+
+            write_arrow(
+                table,
+                self.path,
+                driver=self.driver,
+                geometry_name="geometry",
+                geometry_type="LineString",
+                crs=(
+                    self.crs if not isinstance(self.crs, dict) else json.dumps(self.crs)
+                ),
+                append=self._append,
+            )
+            self._append = True
+        return table.num_rows
+
+    def close(self):
+        """Finish file."""
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def _write_parquet(self, table):
+        import pyarrow.parquet as pq
+
+        if self._parquet is None:
+            column = dict(encoding="WKB", geometry_types=["LineString"])
+            if isinstance(self.crs, dict):
+                column.update(crs=self.crs)
+            geo = dict(
+                version="1.0.0",
+                primary_column="geometry",
+                columns=dict(geometry=column),
+            )
+            schema = table.schema.with_metadata(
+                dict(table.schema.metadata or {}, geo=json.dumps(geo))
+            )
+            self._parquet = pq.ParquetWriter(self.path, schema)
+        self._parquet.write_table(table)
@@ -0,0 +1,187 @@
+from collections import namedtuple
+import concurrent.futures
+import logging
+import os
+import shapely
+from shapely.geometry import MultiLineString
+
+from label_centerlines._src import get_centerline
+from label_centerlines.exceptions import CenterlineError
+
+logger = logging.getLogger(__name__)
+
+
+CenterlineResult = namedtuple("CenterlineResult", ["index", "centerline", "error"])
+CenterlineResult.__doc__ = """
+Centerline extracted from the input geometry at index.
+
+Either centerline is a LineString or MultiLineString and error is None, or
+centerline is None and error is the exception raised for this geometry.
+"""
+
+
+def get_centerlines(
+    geoms,
+    segmentize_maxlen=0.5,
+    max_points=3000,
+    simplification=0.05,
+    smooth_sigma=5,
+    max_paths=5,
+    workers=None,
+    max_in_flight=None,
+    **kwargs,
+):
+    """
+    Yield centerlines from many geometries as they are finished.
+
+    MultiPolygons are split up into their parts which are processed
+    independently and combined into a MultiLineString once all parts are
+    finished, just like get_centerline() does.
+
+    Parameters:
+    -----------
+    geoms : Iterable of shapely Polygons or MultiPolygons or their WKB.
+    segmentize_maxlen : Maximum segment length for polygon borders.
+        (default: 0.5)
+    max_points : Number of points per geometry allowed before simplifying.
+        (default: 3000)
+    simplification : Simplification threshold.
+        (default: 0.05)
+    smooth_sigma : Smoothness of the output centerlines.
+        (default: 5)
+    max_paths : Number of longest paths used to create the centerlines.
+        (default: 5)
+    workers : Number of worker processes, 0 processes all geometries in the
+        current process in input order.
+        (default: number of CPUs)
+    max_in_flight : Maximum number of parts submitted to the workers at the
+        same time, so geoms is only consumed as fast as results are finished.
+        (default: 4 times workers)
+    kwargs : Further keyword arguments passed on to get_centerline(), e.g.
+        engine or tile_length.
+
+    Yields:
+    -------
+    CenterlineResult : index of input geometry, centerline and error
+
+    """
+    kwargs.update(
+        segmentize_maxlen=segmentize_maxlen,
+        max_points=max_points,
+        simplification=simplification,
+        smooth_sigma=smooth_sigma,
+        max_paths=max_paths,
+    )
+    if workers == 0:
+        for index, geom in enumerate(geoms):
+            try:
+                yield CenterlineResult(
+                    index, get_centerline(_load(geom), **kwargs), None
+                )
+            except Exception as e:
+                yield CenterlineResult(index, None, e)
+        return
+
+    workers = workers or os.cpu_count()
+    # parts of MultiPolygons which are not finished yet
+    multiparts = {}
+    errors = []
+
+    def _tasks():
+        for index, geom in enumerate(geoms):
+            try:
+                geom = _load(geom)
+                if geom.geom_type == "MultiPolygon" and geom.is_empty:
+                    errors.append(_combine_parts(index, []))
+                elif geom.geom_type == "MultiPolygon":
+                    multiparts[index] = [None] * len(geom.geoms)
+                    for part, subgeom in enumerate(geom.geoms):
+                        yield (index, part), (shapely.to_wkb(subgeom), kwargs)
+                else:
+                    yield (index, None), (shapely.to_wkb(geom), kwargs)
+            except Exception as e:
+                errors.append(CenterlineResult(index, None, e))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for (index, part), future in _as_completed(
+            executor, _part_worker, _tasks(), max_in_flight or 4 * workers
+        ):
+            while errors:
+                yield errors.pop(0)
+            if part is None:
+                try:
+                    yield CenterlineResult(
+                        index, shapely.from_wkb(future.result()), None
+                    )
+                except Exception as e:
+                    yield CenterlineResult(index, None, e)
+                continue
+
+            try:
+                multiparts[index][part] = future.result()
+            except Exception as e:
+                multiparts[index][part] = e
+            if any(result is None for result in multiparts[index]):
+                continue
+            yield _combine_parts(index, multiparts.pop(index))
+        while errors:
+            yield errors.pop(0)
+
+
+def _combine_parts(index, results):
+    """Return result of MultiPolygon from results of its parts."""
+    for result in results:
+        if isinstance(result, Exception) and not isinstance(result, CenterlineError):
+            return CenterlineResult(index, None, result)
+    for result in results:
+        if isinstance(result, CenterlineError):
+            logger.debug("subgeometry error: %s", result)
+    # for MultiPolygon, only raise CenterlineError if all subgeometries fail
+    sub_centerlines = [
+        shapely.from_wkb(result)
+        for result in results
+        if not isinstance(result, Exception)
+    ]
+    if sub_centerlines:
+        return CenterlineResult(index, MultiLineString(sub_centerlines), None)
+    return CenterlineResult(index, None, CenterlineError("all subgeometries failed"))
+
+
+def _as_completed(executor, fn, tasks, max_in_flight):
+    """
+    Yield keys and futures of tasks as they are finished.
+
+    Tasks are (key, args) tuples which are only submitted to executor as long
+    as less than max_in_flight tasks are pending.
+    """
+    tasks = iter(tasks)
+    pending = {}
+
+    def _submit():
+        while len(pending) < max_in_flight:
+            try:
+                key, args = next(tasks)
+            except StopIteration:
+                return
+            pending[executor.submit(fn, *args)] = key
+
+    _submit()
+    while pending:
+        done, _ = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            key = pending.pop(future)
+            _submit()
+            yield key, future
+
+
+def _load(geom):
+    """Return shapely geometry from geometry or WKB."""
+    if isinstance(geom, (bytes, bytearray, memoryview)):
+        return shapely.from_wkb(bytes(geom))
+    return geom
+
+
+def _part_worker(wkb, kwargs):
+    return shapely.to_wkb(get_centerline(shapely.from_wkb(wkb), **kwargs))
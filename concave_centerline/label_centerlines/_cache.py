@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import shapely
+
+from label_centerlines.exceptions import CenterlineError
+
+logger = logging.getLogger(__name__)
+
+# caches unpickled in a process by process ID, path and max_size
+_process_caches = {}
+
+
+class CenterlineCache:
+    """
+    Persistent cache of extracted centerlines in a SQLite file.
+
+    Entries are addressed by a hash of the input geometry WKB, all extraction
+    parameters and the library version, so changed features or parameters
+    never hit stale entries. Failed extractions (CenterlineError) are cached
+    as well. If the cache grows beyond max_size bytes, the least recently
+    used entries are removed.
+
+    The database is opened lazily, so a cache can be pickled and used from
+    several worker processes at the same time. All copies of a cache
+    unpickled in a process are the same instance, so tasks sent to a worker
+    process share one connection and count their new entries together.
+
+    Parameters:
+    -----------
+    path : Path of the SQLite file, created if it does not exist.
+    max_size : Maximum size of all cached centerlines in bytes.
+        (default: 1 GiB)
+    """
+
+    # check cache size after this many new entries per process
+    EVICT_INTERVAL = 100
+
+    def __init__(self, path, max_size=2**30):
+        self.path = os.fspath(path)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._added = 0
+
+    def __repr__(self):
+        return "CenterlineCache(%r, max_size=%s)" % (self.path, self.max_size)
+
+    def __reduce__(self):
+        return _unpickle, (self.path, self.max_size)
+
+    def key(self, geom, **params):
+        """Return key of geometry extracted with parameters."""
+        from label_centerlines import __version__
+
+        digest = hashlib.sha256(shapely.to_wkb(geom))
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        digest.update(__version__.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Return cached centerline or None if key is not cached.
+
+        Raises:
+        -------
+        CenterlineError : if the extraction failed when it was cached
+        """
+        row = (
+            self._connect()
+            .execute("SELECT wkb, error FROM centerlines WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._connection:
+            self._connection.execute(
+                "UPDATE centerlines SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        wkb, error = row
+        if error is not None:
+            raise CenterlineError(error)
+        return shapely.from_wkb(wkb)
+
+    def put(self, key, centerline=None, error=None):
+        """Cache centerline or CenterlineError of key."""
+        wkb = None if centerline is None else shapely.to_wkb(centerline)
+        error = None if error is None else str(error)
+        with self._connect():
+            self._connection.execute(
+                "INSERT OR REPLACE INTO centerlines VALUES (?, ?, ?, ?, ?)",
+                (key, wkb, error, len(wkb or b"") + len(error or ""), time.time()),
+            )
+        self._added += 1
+        if self._added % self.EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries exceeding max_size."""
+        with self._connect():
+            removed = self._connection.execute(
+                """
+                DELETE FROM centerlines WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (
+                            ORDER BY accessed DESC, key
+                        ) AS total FROM centerlines
+                    ) WHERE total > ?
+                )
+                """,
+                (self.max_size,),
+            ).rowcount
+        if removed:
+            logger.debug("evicted %s cached centerlines", removed)
+
+    def close(self):
+        """Remove entries exceeding max_size and close database."""
+        self.evict()
+        self._connection.close()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            # allow reading while other processes write
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._connection:
+                self._connection.execute("""
+                    CREATE TABLE IF NOT EXISTS centerlines (
+                        key TEXT PRIMARY KEY,
+                        wkb BLOB,
+                        error TEXT,
+                        size INTEGER,
+                        accessed REAL
+                    )
+                    """)
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS accessed ON centerlines (accessed)"
+                )
+        return self._connection
+
+
+def _unpickle(path, max_size):
+    """Return cache of this process for path and max_size."""
+    # forked processes inherit the caches of their parent, whose connections
+    # must not be used in the child
+    key = (os.getpid(), path, max_size)
+    if key not in _process_caches:
+        _process_caches[key] = CenterlineCache(path, max_size=max_size)
+    return _process_caches[key]
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Diff:
+    """
+    Compare features against the previous version of the input.
+
+    Features are matched by ID. Features with the same geometry as before
+    are not extracted again: if their attributes are the same as well, their
+    centerlines are copied from the previous output as they are, otherwise
+    with the new attributes. Only hashes of geometries and attributes of the
+    previous input are kept in memory.
+
+    Parameters:
+    -----------
+    previous : Iterable of (feature ID, WKB geometry, attribute dictionary)
+        tuples of the previous input.
+
+    Attributes:
+    -----------
+    copied : IDs of unchanged features.
+    updated : Dictionary of IDs and new attributes of features with
+        unchanged geometries.
+    """
+
+    def __init__(self, previous):
+        self._previous = {
+            feature_id: (_digest(wkb), _digest(_dumps(properties)))
+            for feature_id, wkb, properties in previous
+        }
+        self.copied = set()
+        self.updated = {}
+        self.changed = 0
+        self.added = 0
+
+    def unchanged(self, feature_id, wkb, properties):
+        """Return whether the centerline of feature can be copied."""
+        hashes = self._previous.get(feature_id)
+        if hashes is None:
+            self.added += 1
+            return False
+        if hashes[0] != _digest(wkb):
+            self.changed += 1
+            return False
+        if hashes[1] == _digest(_dumps(properties)):
+            self.copied.add(feature_id)
+        else:
+            self.updated[feature_id] = properties
+        return True
+
+    def summary(self):
+        """Log number of unchanged, updated, changed, added and removed features."""
+        removed = (
+            len(self._previous) - len(self.copied) - len(self.updated) - self.changed
+        )
+        logger.info(
+            "diff: %s unchanged, %s with new attributes, %s changed, %s added, "
+            "%s removed or filtered out features",
+            len(self.copied),
+            len(self.updated),
+            self.changed,
+            self.added,
+            removed,
+        )
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _dumps(properties):
+    return json.dumps(dict(properties), sort_keys=True, default=str).encode()
@@ -0,0 +1,257 @@
+import heapq
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import (
+    connected_components,
+    dijkstra,
+    minimum_spanning_tree,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SkeletonGraph:
+    """
+    Undirected weighted graph of Voronoi vertices.
+
+    The graph is stored as a symmetric CSR adjacency matrix, so degrees,
+    shortest paths and path reconstruction run on arrays instead of per node
+    Python objects. Internally nodes are numbered in order of their first
+    appearance in the edges, all public methods use the original vertex ids.
+
+    Parameters:
+    -----------
+    edges : array of shape (n, 2) with vertex ids
+    weights : array of shape (n, ) with edge weights
+    """
+
+    def __init__(self, edges, weights):
+        edges = np.asarray(edges, dtype=np.intp).reshape(-1, 2)
+        weights = np.asarray(weights, dtype=np.float64)
+        unique, first = np.unique(edges.ravel(), return_index=True)
+        appearance = np.argsort(first)
+        rank = np.empty(len(unique), dtype=np.intp)
+        rank[appearance] = np.arange(len(unique))
+        local = rank[np.searchsorted(unique, edges)]
+
+        # vertex id of every node
+        self.nodes = unique[appearance]
+        self.edges = local
+        self.weights = weights
+        self.adjacency = csr_matrix(
+            (
+                np.concatenate([weights, weights]),
+                (
+                    np.concatenate([local[:, 0], local[:, 1]]),
+                    np.concatenate([local[:, 1], local[:, 0]]),
+                ),
+            ),
+            shape=(len(self.nodes), len(self.nodes)),
+        )
+        self.degree = np.diff(self.adjacency.indptr)
+        self._unique = unique
+        self._rank = rank
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def end_nodes(self):
+        """Return array of vertex ids with just one neighbor node."""
+        return self.nodes[self.degree == 1]
+
+    def is_forest(self):
+        """Return whether graph does not contain any cycles."""
+        n_components, _ = connected_components(self.adjacency, directed=False)
+        return self.adjacency.nnz // 2 == len(self.nodes) - n_components
+
+    def spanning_tree(self):
+        """Return minimum spanning forest, i.e. graph without any cycles."""
+        tree = minimum_spanning_tree(self.adjacency).tocoo()
+        return SkeletonGraph(
+            np.stack([self.nodes[tree.row], self.nodes[tree.col]], axis=1), tree.data
+        )
+
+    def shortest_path(self, source, target):
+        """Return vertex ids of shortest path from source to target or None."""
+        source, target = self._to_local([source, target])
+        _, predecessors = self._search(source)
+        if source != target and predecessors[target] < 0:
+            return None
+        return self.nodes[self._path(predecessors, source, target)].tolist()
+
+    def longest_paths(self, nodes, max_paths, exact=True):
+        """
+        Return longest paths of all possible paths between a list of nodes.
+
+        The skeleton graph is almost always a tree (or a forest of trees), in
+        which case the paths are found with a few single source searches
+        instead of one search per pair of nodes. Graphs containing cycles fall
+        back to one single source search per node unless exact is False, in
+        which case the search for trees is used as an approximation.
+        """
+        if max_paths < 1:
+            return []
+        nodes = self._to_local(nodes)
+        if not exact or self.is_forest():
+            paths = self._longest_tree_paths(nodes, max_paths)
+        else:
+            logger.debug("skeleton graph contains cycles")
+            paths = self._longest_graph_paths(nodes, max_paths)
+        return [x for (y, x) in sorted(paths, reverse=True)]
+
+    def longest_paths_between(self, sources, targets, max_paths):
+        """
+        Return longest paths from any of sources to any of targets.
+
+        Paths start at the source node. sources and targets must not share
+        nodes.
+        """
+        if max_paths < 1:
+            return []
+        sources, targets = self._to_local(sources), self._to_local(targets)
+        # orient paths from their source
+        order = np.full(len(self.nodes), -1, dtype=np.intp)
+        order[sources] = np.arange(len(sources))
+        order[targets] = len(sources) + np.arange(len(targets))
+        paths = []
+        for source in sources:
+            distances, predecessors = self._search(source)
+            self._push_paths(
+                paths,
+                max_paths,
+                source,
+                targets[np.isfinite(distances[targets])],
+                distances,
+                predecessors,
+                order,
+            )
+        return [x for (y, x) in sorted(paths, reverse=True)]
+
+    def to_networkx(self):
+        """Return graph as networkx.Graph for debugging."""
+        import networkx as nx
+
+        graph = nx.Graph()
+        graph.add_nodes_from(self.nodes.tolist())
+        graph.add_weighted_edges_from(
+            zip(
+                self.nodes[self.edges[:, 0]].tolist(),
+                self.nodes[self.edges[:, 1]].tolist(),
+                self.weights.tolist(),
+            )
+        )
+        return graph
+
+    def _to_local(self, nodes):
+        return self._rank[np.searchsorted(self._unique, np.asarray(nodes))]
+
+    def _search(self, source):
+        # adjacency is symmetric, so a directed search is sufficient
+        return dijkstra(
+            self.adjacency, directed=True, indices=source, return_predecessors=True
+        )
+
+    def _path(self, predecessors, source, target):
+        path = [target]
+        while path[-1] != source:
+            path.append(predecessors[path[-1]])
+        return np.array(path[::-1], dtype=np.intp)
+
+    def _longest_tree_paths(self, nodes, max_paths):
+        """
+        Return (distance, path) tuples of the longest paths within a forest.
+
+        In a tree, the node farthest away from any node is one of the two ends
+        of the diameter, which itself is found by two sweeps. This gives an
+        upper bound for the paths starting at every node, so nodes can be
+        searched in order of decreasing bound until no remaining node can
+        improve the result.
+        """
+        order = np.full(len(self.nodes), -1, dtype=np.intp)
+        order[nodes] = np.arange(len(nodes))
+        eccentricity = np.full(len(self.nodes), -np.inf)
+        searches = {}
+        for node in nodes:
+            if eccentricity[node] > -np.inf:
+                continue
+            # two sweeps per connected component determine the diameter ends
+            first = self._farthest(self._search(node)[0], nodes)
+            searches[first] = self._search(first)
+            second = self._farthest(searches[first][0], nodes)
+            searches[second] = self._search(second)
+            reached = nodes[np.isfinite(searches[first][0][nodes])]
+            eccentricity[reached] = np.maximum(
+                searches[first][0][reached], searches[second][0][reached]
+            )
+
+        paths = []
+        searched = np.zeros(len(self.nodes), dtype=bool)
+        for source in nodes[np.lexsort((order[nodes], -eccentricity[nodes]))]:
+            source = int(source)
+            if len(paths) == max_paths and eccentricity[source] < _bound(paths):
+                break
+            if source in searches:
+                distances, predecessors = searches.pop(source)
+            else:
+                distances, predecessors = self._search(source)
+            searched[source] = True
+            targets = nodes[~searched[nodes] & np.isfinite(distances[nodes])]
+            self._push_paths(
+                paths, max_paths, source, targets, distances, predecessors, order
+            )
+        return paths
+
+    def _longest_graph_paths(self, nodes, max_paths):
+        """Return (distance, path) tuples of the longest paths within any graph."""
+        order = np.full(len(self.nodes), -1, dtype=np.intp)
+        order[nodes] = np.arange(len(nodes))
+        paths = []
+        for i, source in enumerate(nodes):
+            distances, predecessors = self._search(source)
+            targets = nodes[i + 1 :]
+            targets = targets[np.isfinite(distances[targets])]
+            self._push_paths(
+                paths, max_paths, source, targets, distances, predecessors, order
+            )
+        return paths
+
+    def _farthest(self, distances, nodes):
+        """Return first of nodes with the largest finite distance."""
+        reached = nodes[np.isfinite(distances[nodes])]
+        return int(reached[np.argmax(distances[reached])])
+
+    def _push_paths(
+        self, paths, max_paths, source, targets, distances, predecessors, order
+    ):
+        """Add paths from source to targets to heap if among the longest."""
+        if len(paths) == max_paths:
+            targets = targets[distances[targets] >= _bound(paths)]
+        # farthest targets first, so once the heap is full, paths are only
+        # built for the few targets which can still enter it
+        targets = targets[np.argsort(-distances[targets], kind="stable")]
+        for target in targets:
+            if len(paths) == max_paths and distances[target] < _bound(paths):
+                break
+            path = self._path(predecessors, source, target)
+            # orient and measure path like a search started from the first node
+            if order[target] < order[source]:
+                path = path[::-1]
+            weights = np.asarray(self.adjacency[path[:-1], path[1:]]).ravel()
+            entry = (sum(weights.tolist()), self.nodes[path].tolist())
+            if len(paths) < max_paths:
+                heapq.heappush(paths, entry)
+            else:
+                heapq.heappushpop(paths, entry)
+
+
+def _bound(paths):
+    """
+    Return lower bound of distances which can still enter the heap of paths.
+
+    Distances of the searches and path lengths summed up in the orientation
+    of the first node can differ by rounding, so candidates tied with the
+    shortest path on the heap are kept and the heap decides on the exact
+    (distance, path) order.
+    """
+    return paths[0][0] - 1e-9 * paths[0][0]
@@ -0,0 +1,215 @@
+import logging
+import numpy as np
+from scipy.spatial import cKDTree
+import shapely
+
+from label_centerlines._src import (
+    CenterlineSkeleton,
+    _smooth_linestring,
+    _stage,
+)
+from label_centerlines.exceptions import CenterlineError
+
+logger = logging.getLogger(__name__)
+
+
+def _get_coarse_to_fine_centerline(
+    geom,
+    segmentize_maxlen=0.5,
+    max_points=3000,
+    simplification=0.05,
+    smooth_sigma=5,
+    max_paths=5,
+    coarse_levels=3,
+    coarse_factor=4,
+    coarse_margin=None,
+    coarse_tolerance=None,
+    stats=None,
+    **kwargs,
+):
+    """
+    Return centerline by refining a coarse centerline level by level.
+
+    The first level extracts the longest paths from the whole Polygon
+    simplified and segmentized with a coarse resolution. Every following
+    level is finer by coarse_factor and only uses outline points and Voronoi
+    vertices within a corridor around the longest paths of the previous
+    level. The corridor follows the local width of the Polygon plus two
+    times the margin, so lobes and side branches away from the paths are
+    never resolved in detail.
+
+    Coarse resolutions are capped by a quarter of the mean width of the
+    Polygon (2 * area / perimeter), as narrow corridors fall apart at
+    coarser resolutions, and levels not coarser than segmentize_maxlen are
+    skipped. Outlines segmentized to more than max_points points are
+    simplified to max_points at the final level anyway, so coarse levels
+    are skipped for them as well. If the first level or the final level
+    fails, or the refined path deviates from the coarse path by more than
+    coarse_tolerance, the centerline is extracted from the whole Polygon
+    instead.
+
+    Coarse levels only approximate the longest paths if their skeleton
+    contains cycles.
+    """
+    if coarse_levels < 1:
+        raise ValueError("coarse_levels must be at least 1")
+    if coarse_tolerance is None:
+        coarse_tolerance = geom.area / geom.length
+    max_resolution = geom.area / geom.length / 2
+    resolutions = sorted(
+        {
+            min(segmentize_maxlen * coarse_factor**level, max_resolution)
+            for level in range(1, coarse_levels)
+        },
+        reverse=True,
+    )
+    resolutions = [r for r in resolutions if r > segmentize_maxlen]
+    if _segmentized_points(geom.exterior, segmentize_maxlen) > max_points:
+        logger.debug("outline exceeds max_points, skip coarse levels")
+        resolutions = []
+    logger.debug("coarse to fine resolutions: %s", resolutions + [segmentize_maxlen])
+
+    corridor = outline_tree = coarse_paths = None
+    for level, resolution in enumerate(resolutions):
+        # coarse levels use an outline simplified by their resolution and only
+        # need approximate longest paths to place the corridor
+        try:
+            skeleton = CenterlineSkeleton(
+                geom.simplify(resolution),
+                resolution,
+                max_points,
+                simplification,
+                stats=stats,
+                corridor=corridor,
+            )
+            with _stage(stats, "paths"):
+                paths = skeleton.graph.longest_paths(
+                    skeleton.end_nodes, max_paths, exact=False
+                )
+            if not paths:
+                raise CenterlineError("no paths found between end nodes")
+        except CenterlineError as e:
+            logger.debug("level %s failed: %s", level, e)
+            break
+        logger.debug(
+            "level %s: %s skeleton nodes, %s paths",
+            level,
+            len(skeleton.graph),
+            len(paths),
+        )
+        if outline_tree is None:
+            # outline points dense enough for the radii of all coarse levels
+            outline_tree = cKDTree(
+                shapely.get_coordinates(
+                    shapely.segmentize(geom.boundary, resolutions[-1])
+                )
+            )
+        # the corridor contains all candidate paths, so finer levels can still
+        # choose among them
+        coarse_paths = [skeleton.vertices[path] for path in paths]
+        corridor = _corridor(
+            outline_tree,
+            coarse_paths,
+            2 * resolution if coarse_margin is None else coarse_margin,
+        )
+
+    path = None
+    if corridor is not None:
+        try:
+            path = CenterlineSkeleton(
+                geom,
+                segmentize_maxlen,
+                max_points,
+                simplification,
+                stats=stats,
+                corridor=corridor,
+            ).path(max_paths, stats=stats)
+        except CenterlineError as e:
+            logger.debug("corridor failed, use whole polygon: %s", e)
+        else:
+            # a corridor missing parts of the centerline cuts it short or
+            # makes it take another way than all candidate paths
+            deviation = min(
+                _deviation(shapely.get_coordinates(path), coarse, resolutions[-1])
+                for coarse in coarse_paths
+            )
+            logger.debug("refined path deviates by %s from coarse paths", deviation)
+            if deviation > coarse_tolerance:
+                logger.debug("coarse_tolerance exceeded, use whole polygon")
+                path = None
+    if path is None:
+        path = CenterlineSkeleton(
+            geom, segmentize_maxlen, max_points, simplification, stats=stats
+        ).path(max_paths, stats=stats)
+
+    with _stage(stats, "smoothing"):
+        return _smooth_linestring(path, smooth_sigma)
+
+
+def _corridor(outline_tree, paths, margin):
+    """
+    Return prepared corridor Polygon around paths.
+
+    Every path segment is buffered by the largest distance of its vertices to
+    the nearest outline point plus two times margin, so the corridor follows
+    the local width of the polygon. Paths are simplified by margin first to
+    keep the number of buffered segments small.
+    """
+    segments, widths = [], []
+    for path in paths:
+        radii = outline_tree.query(path)[0]
+        simplified = _simplified_indexes(path, margin)
+        segments.append(np.stack([path[simplified[:-1]], path[simplified[1:]]], axis=1))
+        widths.append(
+            np.maximum(
+                np.maximum.reduceat(radii, simplified)[:-1], radii[simplified[1:]]
+            )
+        )
+    corridor = shapely.union_all(
+        shapely.buffer(
+            shapely.linestrings(np.concatenate(segments)),
+            np.concatenate(widths) + 2 * margin,
+            quad_segs=4,
+        )
+    )
+    shapely.prepare(corridor)
+    return corridor
+
+
+def _simplified_indexes(path, tolerance):
+    """Return indexes of path vertices kept by simplifying with tolerance."""
+    simplified = shapely.get_coordinates(shapely.linestrings(path).simplify(tolerance))
+    # simplified vertices are a subset of the path vertices in the same order
+    indexes = [0]
+    for vertex in simplified[1:]:
+        index = indexes[-1] + 1
+        while not (path[index] == vertex).all():
+            index += 1
+        indexes.append(index)
+    return np.array(indexes)
+
+
+def _segmentized_points(ring, max_len):
+    """Return number of points of ring segmentized by max_len."""
+    coords = shapely.get_coordinates(ring)
+    lengths = np.hypot(*(coords[1:] - coords[:-1]).T)
+    return len(lengths) + int((lengths // max_len).sum())
+
+
+def _deviation(path, other, spacing):
+    """
+    Return Hausdorff distance between paths approximated by their vertices.
+
+    Both paths are segmentized by spacing first, so the distance is
+    overestimated by at most half of spacing.
+    """
+    points = shapely.get_coordinates(
+        shapely.segmentize(shapely.linestrings(path), spacing)
+    )
+    other_points = shapely.get_coordinates(
+        shapely.segmentize(shapely.linestrings(other), spacing)
+    )
+    return max(
+        cKDTree(other_points).query(points)[0].max(),
+        cKDTree(points).query(other_points)[0].max(),
+    )
@@ -0,0 +1,266 @@
+from collections import deque, namedtuple
+import concurrent.futures
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+_Killed = namedtuple("_Killed", ["item", "reason", "stage", "elapsed"])
+_Killed.__doc__ = """
+Placeholder result of an item whose worker exceeded a limit and was killed.
+
+reason is "timeout" or "memory", or "died" if the worker process exited on
+its own, e.g. killed by the OOM killer or crashed. stage is the last stage
+reported with _report_stage() before the worker was killed.
+"""
+
+# connection to the supervisor within worker processes
+_connection = None
+
+
+def _report_stage(stage):
+    """Report stage reached by the current item to the supervisor."""
+    if _connection is not None:
+        _connection.send(("stage", stage))
+
+
+class _GuardedPool:
+    """
+    Process pool killing and replacing workers exceeding per item limits.
+
+    Tasks are lists of items which are processed one by one by the same
+    worker. If processing an item takes longer than timeout seconds or the
+    worker process uses more than max_rss bytes of memory, the worker is
+    killed, a _Killed placeholder is put in place of the item result and the
+    remaining items of the task are passed on to a new worker. Workers dying
+    on their own are replaced the same way.
+
+    Futures returned by submit() can be used like those of
+    concurrent.futures executors.
+
+    Parameters:
+    -----------
+    workers : Number of worker processes.
+        (default: number of CPUs)
+    timeout : Maximum seconds per item.
+        (default: None)
+    max_rss : Maximum resident memory of a worker process in bytes.
+        (default: None)
+    poll : Seconds between checking the limits.
+        (default: 0.2)
+    """
+
+    def __init__(self, workers=None, timeout=None, max_rss=None, poll=0.2):
+        self.workers = workers or os.cpu_count()
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.poll = poll
+        self.killed = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup, self._notify = multiprocessing.Pipe(duplex=False)
+        self._closing = False
+        self._workers = [_Worker() for _ in range(self.workers)]
+        self._supervisor = threading.Thread(
+            target=self._supervise, name="supervisor", daemon=True
+        )
+        self._supervisor.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def submit(self, fn, items, *args):
+        """Return Future of list of fn(item, *args) results for all items."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._queue.append(_Task(future, fn, list(items), args))
+        self._notify.send(None)
+        return future
+
+    def shutdown(self):
+        """Stop all workers after all submitted tasks are finished."""
+        with self._lock:
+            self._closing = True
+        self._notify.send(None)
+        self._supervisor.join()
+
+    def _supervise(self):
+        while True:
+            with self._lock:
+                for worker in self._workers:
+                    if worker.task is None and self._queue:
+                        worker.start(self._queue.popleft())
+                busy = [worker for worker in self._workers if worker.task is not None]
+                if self._closing and not busy and not self._queue:
+                    break
+            ready = wait(
+                [self._wakeup] + [worker.connection for worker in busy],
+                timeout=self.poll,
+            )
+            if self._wakeup in ready:
+                while self._wakeup.poll():
+                    self._wakeup.recv()
+            for worker in busy:
+                if worker.connection in ready:
+                    try:
+                        while worker.connection.poll():
+                            worker.receive()
+                    except (EOFError, OSError):
+                        if worker.task is None:
+                            self._replace(worker)
+                        else:
+                            self._kill(worker, "died")
+                        continue
+                reason = self._exceeded(worker)
+                if reason is not None:
+                    self._kill(worker, reason)
+        for worker in self._workers:
+            worker.stop()
+
+    def _exceeded(self, worker):
+        """Return limit exceeded by worker or None."""
+        if worker.task is None:
+            return None
+        if self.timeout is not None and worker.elapsed() > self.timeout:
+            return "timeout"
+        if self.max_rss is not None:
+            rss = _rss(worker.process.pid)
+            if rss is not None and rss > self.max_rss:
+                return "memory"
+        return None
+
+    def _kill(self, worker, reason):
+        task = worker.task
+        killed = _Killed(
+            task.items[worker.position], reason, worker.stage, worker.elapsed()
+        )
+        logger.warning(
+            "lost worker after %.1fs in stage %s: %s",
+            killed.elapsed,
+            killed.stage,
+            reason,
+        )
+        self.killed += 1
+        worker.process.kill()
+        task.results.append(killed)
+        worker.task = None
+        replacement = self._replace(worker)
+        if len(task.results) < len(task.items):
+            replacement.start(task)
+        else:
+            task.future.set_result(task.results)
+
+    def _replace(self, worker):
+        worker.stop()
+        replacement = _Worker()
+        self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+
+class _Task:
+    def __init__(self, future, fn, items, args):
+        self.future = future
+        self.fn = fn
+        self.items = items
+        self.args = args
+        self.results = []
+
+
+class _Worker:
+    """Worker process and the state of the item it processes."""
+
+    def __init__(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_work, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.position = None
+        self.stage = None
+        self.started = None
+
+    def start(self, task):
+        """Send remaining items of task."""
+        self.task = task
+        self.position = len(task.results)
+        self.stage = None
+        self.started = time.monotonic()
+        if not task.results and not task.future.set_running_or_notify_cancel():
+            self.task = None
+            return
+        self.connection.send((task.fn, task.items[self.position :], task.args))
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def receive(self):
+        """Handle one message of the worker process."""
+        message = self.connection.recv()
+        if message[0] == "stage":
+            self.stage = message[1]
+        elif message[0] == "result":
+            self.task.results.append(message[1])
+            self.position += 1
+            self.stage = None
+            self.started = time.monotonic()
+            if len(self.task.results) == len(self.task.items):
+                self.task.future.set_result(self.task.results)
+                self.task = None
+        elif message[0] == "error":
+            self.task.future.set_exception(message[1])
+            self.task = None
+
+    def stop(self):
+        if self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def _work(connection):
+    """Process items sent by the supervisor until None is received."""
+    global _connection
+    _connection = connection
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        fn, items, args = message
+        for item in items:
+            try:
+                result = fn(item, *args)
+            except Exception as e:
+                connection.send(("error", e))
+                break
+            connection.send(("result", result))
+
+
+def _rss(pid):
+    """Return resident memory of process in bytes or None if unknown."""
+    try:
+        with open("/proc/%s/statm" % pid) as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        return psutil.Process(pid).memory_info().rss
+    except psutil.Error:
+        return None
@@ -0,0 +1,227 @@
+import logging
+import math
+import numpy as np
+from scipy.ndimage import binary_fill_holes, distance_transform_edt
+import shapely
+from shapely.geometry import LineString, MultiLineString
+
+from label_centerlines._graph import SkeletonGraph
+from label_centerlines._src import _get_least_curved_path, _smooth_linestring, _stage
+from label_centerlines.exceptions import CenterlineError
+
+logger = logging.getLogger(__name__)
+
+
+def _get_raster_centerline(
+    geom,
+    segmentize_maxlen=0.5,
+    smooth_sigma=5,
+    max_paths=5,
+    cell_size=None,
+    max_cells=4000000,
+    stats=None,
+    **kwargs,
+):
+    """
+    Return centerline from the skeleton of the rasterized Polygon.
+
+    The Polygon is rasterized with cell_size, cells closer than one cell to
+    the boundary are removed using the Euclidean distance transform and the
+    remaining cells are thinned to a one cell wide skeleton. The longest
+    paths are then searched on the graph of neighboring skeleton cells and
+    the least curved one is smoothed, just like the paths of the Voronoi
+    skeleton.
+
+    Memory and run time only depend on the number of cells, which is limited
+    by coarsening cell_size until the raster has at most max_cells cells.
+    Parts of the Polygon narrower than about three cells are lost.
+    """
+    try:
+        from skimage.morphology import skeletonize
+    except ImportError:
+        raise ImportError("engine 'raster' requires scikit-image")
+
+    if cell_size is None:
+        cell_size = segmentize_maxlen
+    if cell_size <= 0:
+        raise ValueError("cell_size must be positive")
+    minx, miny, maxx, maxy = geom.bounds
+    # pad raster by one cell, so the Polygon never touches the raster border
+    width = math.ceil((maxx - minx) / cell_size) + 2
+    height = math.ceil((maxy - miny) / cell_size) + 2
+    if width * height > max_cells:
+        factor = math.sqrt(width * height / max_cells)
+        logger.debug("raster too large, coarsen cell size by %s", factor)
+        cell_size *= factor
+        width = math.ceil((maxx - minx) / cell_size) + 2
+        height = math.ceil((maxy - miny) / cell_size) + 2
+    originx, originy = minx - cell_size, miny - cell_size
+
+    with _stage(stats, "rasterize"):
+        mask = _rasterize(geom, originx, originy, cell_size, width, height)
+        # inlets narrower than a cell can be closed off by rasterizing
+        if not geom.interiors:
+            mask = binary_fill_holes(mask)
+
+    with _stage(stats, "distance"):
+        distance = distance_transform_edt(mask)
+
+    with _stage(stats, "skeletonize"):
+        skeleton = skeletonize(distance > 1)
+
+    with _stage(stats, "graph"):
+        graph = _graph_from_skeleton(skeleton)
+        # without holes, cycles are only left where thinning got stuck around
+        # single cells and can be broken up
+        if not geom.interiors and not graph.is_forest():
+            logger.debug("break up cycles of raster skeleton")
+            graph = graph.spanning_tree()
+
+    def _coords(cells):
+        rows, cols = np.divmod(np.asarray(cells, dtype=np.intp), width)
+        return np.stack(
+            [originx + (cols + 0.5) * cell_size, originy + (rows + 0.5) * cell_size],
+            axis=-1,
+        )
+
+    with _stage(stats, "end_nodes"):
+        end_nodes = graph.end_nodes()
+    if stats is not None:
+        stats.count(
+            input_points=len(geom.exterior.coords),
+            raster_cells=width * height,
+            polygon_cells=int(mask.sum()),
+            graph_nodes=len(graph),
+            graph_edges=len(graph.edges),
+            end_nodes=len(end_nodes),
+        )
+        stats.add_diagnostic(
+            "skeleton",
+            lambda: MultiLineString(list(_coords(graph.nodes[graph.edges]))),
+        )
+    if len(end_nodes) < 2:
+        logger.debug("Polygon has too few cells")
+        raise CenterlineError("Polygon has too few cells")
+
+    with _stage(stats, "paths"):
+        longest_paths = graph.longest_paths(end_nodes, max_paths)
+        if longest_paths:
+            path = _get_least_curved_cells(
+                [_coords(path) for path in longest_paths],
+                cell_size,
+                2 * cell_size * distance.max(),
+            )
+            path = longest_paths[path]
+    if stats is not None:
+        stats.count(longest_paths=len(longest_paths))
+        stats.add_diagnostic(
+            "longest_paths",
+            lambda: MultiLineString([_coords(p) for p in longest_paths]),
+        )
+    if not longest_paths:
+        logger.debug("no paths found between end nodes")
+        raise CenterlineError("no paths found between end nodes")
+
+    with _stage(stats, "smoothing"):
+        centerline = _smooth_linestring(LineString(_coords(path)), smooth_sigma)
+    if stats is not None:
+        stats.count(centerline_points=len(centerline.coords))
+    return centerline
+
+
+def _get_least_curved_cells(paths, cell_size, tolerance):
+    """
+    Return index of least curved path of cell coordinates.
+
+    Unlike the Voronoi skeleton, the raster skeleton has hardly any short
+    branches, so the longest paths are not just variants of the longest path
+    ending in different branches near its ends. Only paths shorter than the
+    longest one by at most tolerance are therefore considered. Curvature is
+    scored on the simplified paths, as the steps between neighboring cells
+    would dominate the angles otherwise.
+    """
+    lengths = np.array([LineString(path).length for path in paths])
+    simplified = [
+        shapely.get_coordinates(LineString(path).simplify(cell_size))
+        for path, length in zip(paths, lengths)
+        if length >= lengths.max() - tolerance
+    ]
+    bounds = np.cumsum([0] + [len(coords) for coords in simplified])
+    least_curved = _get_least_curved_path(
+        [np.arange(start, end) for start, end in zip(bounds[:-1], bounds[1:])],
+        np.concatenate(simplified),
+    )
+    # candidates are a prefix of the paths, as they are sorted by length
+    return int(np.searchsorted(bounds, least_curved[0], side="right")) - 1
+
+
+def _rasterize(geom, originx, originy, cell_size, width, height):
+    """
+    Return boolean array of cells with their center within geom.
+
+    Instead of testing every cell, the outline is intersected with the
+    horizontal lines through the cell centers of every row. Cells between
+    the first and second, third and fourth, ... crossing of a row are within
+    geom, so the cost grows with the number of outline segments and rows
+    rather than the number of cells.
+    """
+    coords = [
+        np.asarray(ring.coords)[:, :2] for ring in [geom.exterior, *geom.interiors]
+    ]
+    starts = np.concatenate([ring[:-1] for ring in coords])
+    ends = np.concatenate([ring[1:] for ring in coords])
+    low = np.minimum(starts[:, 1], ends[:, 1])
+    high = np.maximum(starts[:, 1], ends[:, 1])
+
+    # candidate rows of every segment, one more on both sides to be safe
+    # from rounding, exactly filtered below
+    first = np.floor((low - originy) / cell_size - 0.5).astype(np.intp)
+    last = np.ceil((high - originy) / cell_size - 0.5).astype(np.intp)
+    counts = last - first + 1
+    segments = np.repeat(np.arange(len(starts)), counts)
+    rows = np.arange(len(segments)) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows += first[segments]
+    y = originy + (rows + 0.5) * cell_size
+    # count crossing where a segment starts but not where it ends, so every
+    # row crosses the closed rings an even number of times
+    crossing = (low[segments] <= y) & (y < high[segments])
+    segments, rows, y = segments[crossing], rows[crossing], y[crossing]
+    start, end = starts[segments], ends[segments]
+    x = start[:, 0] + (y - start[:, 1]) * (end[:, 0] - start[:, 0]) / (
+        end[:, 1] - start[:, 1]
+    )
+
+    order = np.lexsort((x, rows))
+    rows, x = rows[order], x[order]
+    cols = np.clip(np.ceil((x - originx) / cell_size - 0.5).astype(np.intp), 0, width)
+    # mark start and end of every span between pairs of crossings
+    changes = np.zeros((height, width + 1), dtype=np.int8)
+    np.add.at(changes, (rows[0::2], cols[0::2]), 1)
+    np.add.at(changes, (rows[1::2], cols[1::2]), -1)
+    return np.cumsum(changes, axis=1, dtype=np.int8)[:, :-1] > 0
+
+
+def _graph_from_skeleton(skeleton):
+    """
+    Return SkeletonGraph of 8-connected skeleton cells.
+
+    Nodes are the flat indexes of the cells. Diagonal neighbors are only
+    connected if they do not share a horizontal or vertical neighbor, which
+    would otherwise form small triangles at every corner of the skeleton.
+    """
+    height, width = skeleton.shape
+    padded = np.zeros((height + 2, width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = skeleton
+
+    def _shifted(drow, dcol):
+        return padded[1 + drow : 1 + drow + height, 1 + dcol : 1 + dcol + width]
+
+    edges, weights = [], []
+    for drow, dcol in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        connected = skeleton & _shifted(drow, dcol)
+        if drow and dcol:
+            connected &= ~_shifted(drow, 0) & ~_shifted(0, dcol)
+        cells = np.flatnonzero(connected)
+        edges.append(np.stack([cells, cells + drow * width + dcol], axis=1))
+        weights.append(np.full(len(cells), math.hypot(drow, dcol)))
+    return SkeletonGraph(np.concatenate(edges), np.concatenate(weights))
@@ -0,0 +1,197 @@
+import heapq
+import json
+import logging
+import time
+import numpy as np
+
+from label_centerlines._stats import CenterlineStats
+
+logger = logging.getLogger(__name__)
+
+# counts of CenterlineStats reported per feature
+COUNTS = (
+    "input_points",
+    "segmentized_points",
+    "simplified_points",
+    "voronoi_vertices",
+    "end_nodes",
+    "longest_paths",
+    "centerline_points",
+    "cache_hits",
+)
+STAGES = CenterlineStats.STAGES
+
+
+class _RunReport:
+    """
+    Machine-readable report of a CLI run.
+
+    Every feature is written as one record with its elapsed seconds, stage
+    times and counts of CenterlineStats, the error class if extraction
+    failed and the PID of the worker. When the report is closed, a summary
+    with throughput, percentiles of elapsed seconds and the slowest features
+    is added.
+
+    Reports ending with .parquet are written with pyarrow, with feature
+    records as rows and the summary as JSON in the "summary" key of the
+    key-value metadata in the file footer. Anything else is written as a
+    JSON object with "features" and "summary". Features are written as they
+    come in, only their elapsed seconds are kept in memory for the
+    percentiles.
+
+    Parameters:
+    -----------
+    path : Path of the report.
+    slowest : Number of slowest features listed in the summary.
+        (default: 10)
+    batch_size : Number of features per Parquet row group.
+        (default: 10000)
+    **metadata : Further items of the summary, e.g. parameters.
+    """
+
+    def __init__(self, path, slowest=10, batch_size=10000, **metadata):
+        self.path = path
+        self.slowest = slowest
+        self.batch_size = batch_size
+        self.metadata = metadata
+        self.parquet = path.endswith(".parquet")
+        self._started = time.time()
+        self._elapsed = []
+        self._slowest = []
+        self._errors = {}
+        self._pids = set()
+        self._stages = {}
+        self._batch = []
+        self._written = 0
+        if self.parquet:
+            self._writer = None
+        else:
+            self._file = open(path, "w")
+            self._file.write('{"features": [')
+
+    def add(self, feature_id, elapsed, info):
+        """
+        Add feature.
+
+        Parameters:
+        -----------
+        feature_id : ID of input feature
+        elapsed : Seconds spent on the feature.
+        info : Dictionary of worker "pid", "error" class name or None and
+            "stats" as returned by CenterlineStats.as_dict() or None if the
+            worker was killed.
+        """
+        stats = info.get("stats") or {}
+        stages = stats.get("stages", {})
+        counts = stats.get("counts", {})
+        record = dict(
+            id=str(feature_id),
+            elapsed=elapsed,
+            pid=info.get("pid"),
+            error=info.get("error"),
+            **{name: counts.get(name) for name in COUNTS},
+            **{"%s_seconds" % stage: stages.get(stage) for stage in STAGES},
+        )
+        self._elapsed.append(elapsed)
+        if record["pid"] is not None:
+            self._pids.add(record["pid"])
+        if record["error"] is not None:
+            self._errors[record["error"]] = self._errors.get(record["error"], 0) + 1
+        for stage, seconds in stages.items():
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+        entry = (elapsed, len(self._elapsed), record["id"], record["error"])
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, entry)
+        elif self.slowest:
+            heapq.heappushpop(self._slowest, entry)
+        self._batch.append(record)
+        if len(self._batch) == self.batch_size:
+            self._flush()
+
+    def summary(self):
+        """Return summary of all features added so far."""
+        wall = time.time() - self._started
+        elapsed = np.asarray(self._elapsed, dtype=float)
+        percentiles = (
+            dict(
+                zip(
+                    ["p50", "p90", "p95", "p99", "max"],
+                    np.percentile(elapsed, [50, 90, 95, 99, 100]).round(3).tolist(),
+                )
+            )
+            if len(elapsed)
+            else {}
+        )
+        return dict(
+            self.metadata,
+            features=len(elapsed),
+            failed=sum(self._errors.values()),
+            errors=self._errors,
+            wall_seconds=round(wall, 3),
+            worker_seconds=round(float(elapsed.sum()), 3),
+            features_per_second=round(len(elapsed) / wall, 3) if wall else None,
+            workers=len(self._pids),
+            elapsed_percentiles=percentiles,
+            stage_seconds={
+                stage: round(seconds, 3) for stage, seconds in self._stages.items()
+            },
+            slowest=[
+                dict(id=feature_id, elapsed=seconds, error=error)
+                for seconds, _, feature_id, error in sorted(self._slowest, reverse=True)
+            ],
+        )
+
+    def close(self):
+        """Write remaining features and summary."""
+        self._flush()
+        summary = self.summary()
+        if self.parquet:
+            if self._writer is None:
+                self._open_parquet()
+            self._writer.add_key_value_metadata(dict(summary=json.dumps(summary)))
+            self._writer.close()
+        else:
+            self._file.write('], "summary": %s}\n' % json.dumps(summary))
+            self._file.close()
+        logger.info(
+            "report: %s features, %.1f features/s, median %.3fs, slowest %.3fs",
+            summary["features"],
+            summary["features_per_second"] or 0.0,
+            summary["elapsed_percentiles"].get("p50", 0.0),
+            summary["elapsed_percentiles"].get("max", 0.0),
+        )
+
+    def _flush(self):
+        if not self._batch:
+            return
+        if self.parquet:
+            import pyarrow as pa
+
+            if self._writer is None:
+                self._open_parquet()
+            self._writer.write_table(
+                pa.Table.from_pylist(self._batch, schema=self._writer.schema)
+            )
+        else:
+            # separate from the features written before
+            if self._written:
+                self._file.write(",")
+            self._file.write(",".join(json.dumps(record) for record in self._batch))
+        self._written += len(self._batch)
+        self._batch = []
+
+    def _open_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema(
+            [
+                ("id", pa.string()),
+                ("elapsed", pa.float64()),
+                ("pid", pa.int64()),
+                ("error", pa.string()),
+                *[(name, pa.int64()) for name in COUNTS],
+                *[("%s_seconds" % stage, pa.float64()) for stage in STAGES],
+            ]
+        )
+        self._writer = pq.ParquetWriter(self.path, schema)
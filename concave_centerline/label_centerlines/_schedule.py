@@ -0,0 +1,125 @@
+import logging
+import numpy as np
+import shapely
+
+logger = logging.getLogger(__name__)
+
+
+class _CostModel:
+    """
+    Linear model of the seconds needed to extract a centerline.
+
+    The terms of every feature are the number of points after segmentizing
+    (vertices plus perimeter / segmentize_maxlen), n log n of the at most
+    max_points points of the Voronoi diagram and the area in squared
+    segmentize_maxlen. The default coefficients were fitted on synthetic
+    corridors, where the area did not add anything to the other terms, so
+    its coefficient is 0.
+
+    Measured times passed to observe() are accumulated, so summary() can log
+    how well the predictions match and coefficients refitted on this input.
+
+    Parameters:
+    -----------
+    segmentize_maxlen : Maximum segment length of polygon borders.
+        (default: 0.5)
+    max_points : Number of points allowed before simplifying.
+        (default: 3000)
+    coefficients : Seconds per unit of every term.
+        (default: COEFFICIENTS)
+    """
+
+    COEFFICIENTS = (2.7e-5, 1.0e-5, 0.0)
+
+    def __init__(self, segmentize_maxlen=0.5, max_points=3000, coefficients=None):
+        self.segmentize_maxlen = segmentize_maxlen
+        self.max_points = max_points
+        self.coefficients = np.asarray(coefficients or self.COEFFICIENTS)
+        self.observed = 0
+        # normal equations of terms plus intercept and sums for correlation
+        self._xtx = np.zeros((4, 4))
+        self._xty = np.zeros(4)
+        self._sums = np.zeros(5)
+
+    def terms(self, geometries):
+        """Return array of terms for a list of WKB geometries."""
+        geoms = shapely.from_wkb(geometries)
+        points = (
+            shapely.get_num_coordinates(geoms)
+            + shapely.length(geoms) / self.segmentize_maxlen
+        )
+        voronoi = np.maximum(np.minimum(points, self.max_points), 2)
+        return np.stack(
+            [
+                points,
+                voronoi * np.log2(voronoi),
+                shapely.area(geoms) / self.segmentize_maxlen**2,
+            ],
+            axis=1,
+        )
+
+    def predict(self, terms):
+        """Return predicted seconds of terms."""
+        return terms @ self.coefficients
+
+    def observe(self, terms, elapsed):
+        """Add measured seconds of terms."""
+        elapsed = np.asarray(elapsed, dtype=float)
+        predicted = self.predict(terms)
+        x = np.column_stack([terms, np.ones(len(terms))])
+        self._xtx += x.T @ x
+        self._xty += x.T @ elapsed
+        self._sums += [
+            predicted.sum(),
+            elapsed.sum(),
+            (predicted**2).sum(),
+            (elapsed**2).sum(),
+            (predicted * elapsed).sum(),
+        ]
+        self.observed += len(terms)
+
+    def summary(self):
+        """Log predicted versus measured seconds and refitted coefficients."""
+        if not self.observed:
+            return
+        n = self.observed
+        predicted, elapsed, predicted2, elapsed2, product = self._sums
+        variance = (n * predicted2 - predicted**2) * (n * elapsed2 - elapsed**2)
+        correlation = (
+            (n * product - predicted * elapsed) / np.sqrt(variance)
+            if variance > 0
+            else float("nan")
+        )
+        fitted = np.linalg.lstsq(self._xtx, self._xty, rcond=None)[0]
+        logger.info(
+            "cost model: %.1fs predicted, %.1fs measured for %s features, "
+            "correlation %.2f, refitted coefficients %s, intercept %.3g",
+            predicted,
+            elapsed,
+            n,
+            correlation,
+            ", ".join("%.3g" % c for c in fitted[:3]),
+            fitted[3],
+        )
+
+
+def _lpt_chunks(costs, chunk_size, target):
+    """
+    Return lists of indexes grouped into chunks, most expensive first.
+
+    Sending the longest tasks first (LPT) keeps expensive features from
+    delaying the end of a run, while the cheap features at the end fill up
+    the remaining time of the workers. Features are grouped into chunks of
+    up to chunk_size features or target cost, so expensive features are
+    sent alone and cheap ones in bulk.
+    """
+    chunks, chunk, total = [], [], 0.0
+    for index in np.argsort(-costs, kind="stable"):
+        chunk.append(int(index))
+        total += costs[index]
+        if len(chunk) == chunk_size or total >= target:
+            chunks.append(chunk)
+            chunk, total = [], 0.0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
@@ -1,13 +1,13 @@
-from itertools import combinations
+from contextlib import nullcontext
 import logging
-import networkx as nx
-from networkx.exception import NetworkXNoPath
+import math
 import numpy as np
-import operator
 from scipy.spatial import Voronoi
 from scipy.ndimage import gaussian_filter1d
-from shapely.geometry import LineString, MultiLineString, Point, MultiPoint
+import shapely
+from shapely.geometry import LineString, MultiLineString, MultiPoint
 
+from label_centerlines._graph import SkeletonGraph
 from label_centerlines.exceptions import CenterlineError
 
 logger = logging.getLogger(__name__)
@@ -20,6 +20,18 @@ def get_centerline(
     simplification=0.05,
     smooth_sigma=5,
     max_paths=5,
+    stats=None,
+    tile_length=None,
+    tile_overlap=None,
+    tile_workers=0,
+    engine="voronoi",
+    coarse_levels=3,
+    coarse_factor=4,
+    coarse_margin=None,
+    coarse_tolerance=None,
+    cell_size=None,
+    max_cells=4000000,
+    cache=None,
 ):
     """
     Return centerline from geometry.
@@ -37,6 +49,49 @@ def get_centerline(
         (default: 5)
     max_paths : Number of longest paths used to create the centerlines.
         (default: 5)
+    stats : Optional CenterlineStats to record stage times, sizes and
+        diagnostic geometries.
+        (default: None)
+    tile_length : Split Polygons longer than tile_length along a coarse
+        centerline into overlapping tiles and join the centerlines of all
+        tiles.
+        (default: None)
+    tile_overlap : Overlap between neighboring tiles.
+        (default: tile_length / 4)
+    tile_workers : Number of worker processes extracting centerlines of
+        tiles, 0 processes all tiles in the current process.
+        (default: 0)
+    engine : "voronoi" extracts the centerline from the Voronoi skeleton of
+        the whole outline, "coarse_to_fine" first extracts it from a coarse
+        outline and then refines it only within a corridor around it,
+        "raster" extracts it from the skeleton of the rasterized Polygon, so
+        run time and memory are bounded by max_cells instead of the number of
+        outline points.
+        (default: "voronoi")
+    coarse_levels : Number of resolution levels of the "coarse_to_fine"
+        engine including the final level.
+        (default: 3)
+    coarse_factor : Factor between segmentize_maxlen of consecutive levels of
+        the "coarse_to_fine" engine.
+        (default: 4)
+    coarse_margin : Margin of the corridor of the "coarse_to_fine" engine,
+        which adds two times the margin to the local polygon width along the
+        paths of the coarser level. Larger values get closer to the
+        "voronoi" engine.
+        (default: two times segmentize_maxlen of the coarser level)
+    coarse_tolerance : Maximum distance between the refined and the coarse
+        centerline of the "coarse_to_fine" engine, which extracts the
+        centerline from the whole outline like the "voronoi" engine if it is
+        exceeded.
+        (default: half the mean width of the Polygon)
+    cell_size : Cell size of the "raster" engine.
+        (default: segmentize_maxlen)
+    max_cells : Maximum number of cells of the "raster" engine, cell_size is
+        coarsened for larger Polygons.
+        (default: 4000000)
+    cache : Optional CenterlineCache to look up centerlines extracted before
+        from the same geometry with the same parameters and to store new ones.
+        (default: None)
 
     Returns:
     --------
@@ -46,56 +101,77 @@ def get_centerline(
     -------
     CenterlineError : if centerline cannot be extracted from Polygon
     TypeError : if input geometry is not Polygon or MultiPolygon
+    ValueError : if engine is unknown
 
     """
     logger.debug("geometry type %s", geom.geom_type)
+    options = dict(
+        segmentize_maxlen=segmentize_maxlen,
+        max_points=max_points,
+        simplification=simplification,
+        smooth_sigma=smooth_sigma,
+        max_paths=max_paths,
+        engine=engine,
+        coarse_levels=coarse_levels,
+        coarse_factor=coarse_factor,
+        coarse_margin=coarse_margin,
+        coarse_tolerance=coarse_tolerance,
+        cell_size=cell_size,
+        max_cells=max_cells,
+    )
 
-    if geom.geom_type == "Polygon":
-        # segmentized Polygon outline
-        outline = _segmentize(geom.exterior, segmentize_maxlen)
-        logger.debug("outline: %s", outline)
-
-        # simplify segmentized geometry if necessary and get points
-        outline_points = outline.coords
-        simplification_updated = simplification
-        while len(outline_points) > max_points:
-            # if geometry is too large, apply simplification until geometry
-            # is simplified enough (indicated by the "max_points" value)
-            simplification_updated += simplification
-            outline_points = outline.simplify(simplification_updated).coords
-        logger.debug("simplification used: %s", simplification_updated)
-        logger.debug("simplified points: %s", MultiPoint(outline_points))
+    if cache is not None:
+        key = cache.key(
+            geom, tile_length=tile_length, tile_overlap=tile_overlap, **options
+        )
+        centerline = cache.get(key)
+        if centerline is not None:
+            logger.debug("return cached centerline")
+            if stats is not None:
+                stats.count(cache_hits=1)
+            return centerline
+        try:
+            centerline = get_centerline(
+                geom,
+                stats=stats,
+                tile_length=tile_length,
+                tile_overlap=tile_overlap,
+                tile_workers=tile_workers,
+                **options,
+            )
+        except CenterlineError as e:
+            cache.put(key, error=e)
+            raise
+        cache.put(key, centerline)
+        return centerline
 
-        # calculate Voronoi diagram and convert to graph but only use points
-        # from within the original polygon
-        vor = Voronoi(outline_points)
-        graph = _graph_from_voronoi(vor, geom)
-        logger.debug("voronoi diagram: %s", _multilinestring_from_voronoi(vor, geom))
+    if geom.geom_type == "Polygon" and tile_length is not None:
+        from label_centerlines._tiles import _get_tiled_centerline
 
-        # determine longest path between all end nodes from graph
-        end_nodes = _get_end_nodes(graph)
-        if len(end_nodes) < 2:
-            logger.debug("Polygon has too few points")
-            raise CenterlineError("Polygon has too few points")
-        logger.debug("get longest path from %s end nodes", len(end_nodes))
-        longest_paths = _get_longest_paths(end_nodes, graph, max_paths)
-        if not longest_paths:
-            logger.debug("no paths found between end nodes")
-            raise CenterlineError("no paths found between end nodes")
-        if logger.getEffectiveLevel() <= 10:
-            logger.debug("longest paths:")
-            for path in longest_paths:
-                logger.debug(LineString(vor.vertices[path]))
-
-        # get least curved path from the longest paths, smooth and
-        # return as LineString
-        centerline = _smooth_linestring(
-            LineString(
-                vor.vertices[_get_least_curved_path(longest_paths, vor.vertices)]
-            ),
-            smooth_sigma,
+        return _get_tiled_centerline(
+            geom,
+            tile_length,
+            tile_overlap=tile_overlap,
+            tile_workers=tile_workers,
+            stats=stats,
+            **options,
         )
-        logger.debug("centerline: %s", centerline)
+
+    elif geom.geom_type == "Polygon":
+        if engine == "voronoi":
+            centerline = CenterlineSkeleton(
+                geom, segmentize_maxlen, max_points, simplification, stats=stats
+            ).centerline(max_paths, smooth_sigma, stats=stats)
+        elif engine == "coarse_to_fine":
+            from label_centerlines._multires import _get_coarse_to_fine_centerline
+
+            centerline = _get_coarse_to_fine_centerline(geom, stats=stats, **options)
+        elif engine == "raster":
+            from label_centerlines._raster import _get_raster_centerline
+
+            centerline = _get_raster_centerline(geom, stats=stats, **options)
+        else:
+            raise ValueError("unknown engine: %s" % engine)
         logger.debug("return linestring")
         return centerline
 
@@ -106,7 +182,12 @@ def get_centerline(
         for subgeom in geom.geoms:
             try:
                 sub_centerline = get_centerline(
-                    subgeom, segmentize_maxlen, max_points, simplification, smooth_sigma
+                    subgeom,
+                    stats=stats,
+                    tile_length=tile_length,
+                    tile_overlap=tile_overlap,
+                    tile_workers=tile_workers,
+                    **options,
                 )
                 sub_centerlines.append(sub_centerline)
             except CenterlineError as e:
@@ -123,25 +204,303 @@ def get_centerline(
         )
 
 
+class CenterlineSkeleton:
+    """
+    Voronoi skeleton of a Polygon to extract centerlines from.
+
+    Segmentizing and simplifying the outline, calculating the Voronoi diagram
+    and building the skeleton graph is the expensive part of get_centerline.
+    A skeleton is built once and can then extract centerlines for any number
+    of max_paths and smooth_sigma values. The longest paths are cached for
+    the largest max_paths requested so far. Skeletons can be pickled, e.g. to
+    send them to worker processes or to store them on disk.
+
+    Parameters:
+    -----------
+    geom : shapely Polygon
+    segmentize_maxlen : Maximum segment length for polygon borders.
+        (default: 0.5)
+    max_points : Number of points per geometry allowed before simplifying.
+        (default: 3000)
+    simplification : Simplification threshold.
+        (default: 0.05)
+    stats : Optional CenterlineStats to record stage times and sizes.
+        (default: None)
+    corridor : Optional Polygon limiting the outline points and the skeleton
+        to the part of geom within the corridor.
+        (default: None)
+
+    Raises:
+    -------
+    CenterlineError : if skeleton cannot be built from Polygon
+    TypeError : if input geometry is not Polygon
+
+    """
+
+    def __init__(
+        self,
+        geom,
+        segmentize_maxlen=0.5,
+        max_points=3000,
+        simplification=0.05,
+        stats=None,
+        corridor=None,
+    ):
+        if geom.geom_type != "Polygon":
+            raise TypeError("Geometry type must be Polygon, not %s" % geom.geom_type)
+        debug = logger.getEffectiveLevel() <= 10
+
+        # segmentized Polygon outline
+        with _stage(stats, "segmentize"):
+            if corridor is None:
+                outline = _segmentize(geom.exterior, segmentize_maxlen)
+            else:
+                outline_coords = _segmentize_within(
+                    geom.exterior, segmentize_maxlen, corridor
+                )
+                if len(outline_coords) < 2:
+                    raise CenterlineError("no outline points within corridor")
+                outline = LineString(outline_coords)
+        logger.debug("outline: %s", outline)
+
+        # simplify segmentized geometry if necessary and get points
+        with _stage(stats, "simplify"):
+            outline_points, self.tolerance = _simplify_outline(
+                outline, max_points, simplification
+            )
+        logger.debug("simplification used: %s", self.tolerance)
+        if debug:
+            logger.debug("simplified points: %s", MultiPoint(outline_points))
+
+        # calculate Voronoi diagram and convert to graph but only use points
+        # from within the original polygon
+        with _stage(stats, "voronoi"):
+            vor = Voronoi(outline_points)
+        self.vertices = vor.vertices
+        with _stage(stats, "graph"):
+            self.graph = _graph_from_voronoi(
+                vor,
+                geom if corridor is None else geom.intersection(corridor),
+            )
+        if debug:
+            logger.debug("voronoi diagram: %s", self._voronoi_diagram())
+
+        with _stage(stats, "end_nodes"):
+            self.end_nodes = self.graph.end_nodes()
+        if stats is not None:
+            stats.tolerance = max(stats.tolerance, self.tolerance)
+            stats.count(
+                input_points=len(geom.exterior.coords),
+                segmentized_points=len(outline.coords),
+                simplified_points=len(outline_points),
+                voronoi_vertices=len(self.vertices),
+                graph_nodes=len(self.graph),
+                graph_edges=len(self.graph.edges),
+                end_nodes=len(self.end_nodes),
+            )
+            stats.add_diagnostic("outline_points", lambda: MultiPoint(outline_points))
+            stats.add_diagnostic("voronoi_diagram", self._voronoi_diagram)
+        if len(self.end_nodes) < 2:
+            logger.debug("Polygon has too few points")
+            raise CenterlineError("Polygon has too few points")
+        self._longest_paths = []
+        self._max_paths = 0
+
+    def longest_paths(self, max_paths=5):
+        """Return longest paths between end nodes as lists of vertex indexes."""
+        if max_paths > self._max_paths:
+            # the longest paths for fewer max_paths are always a prefix
+            logger.debug("get longest path from %s end nodes", len(self.end_nodes))
+            self._longest_paths = self.graph.longest_paths(self.end_nodes, max_paths)
+            self._max_paths = max_paths
+        return self._longest_paths[:max_paths]
+
+    def path(self, max_paths=5, stats=None):
+        """
+        Return least curved of the longest paths as unsmoothed LineString.
+
+        Parameters:
+        -----------
+        max_paths : Number of longest paths to choose from.
+            (default: 5)
+        stats : Optional CenterlineStats to record stage times and sizes.
+            (default: None)
+
+        Returns:
+        --------
+        geometry : LineString
+
+        Raises:
+        -------
+        CenterlineError : if no paths were found between end nodes
+
+        """
+        with _stage(stats, "paths"):
+            longest_paths = self.longest_paths(max_paths)
+            if longest_paths:
+                path = _get_least_curved_path(longest_paths, self.vertices)
+        if stats is not None:
+            stats.count(longest_paths=len(longest_paths))
+            stats.add_diagnostic(
+                "longest_paths",
+                lambda: MultiLineString([self.vertices[p] for p in longest_paths]),
+            )
+        if not longest_paths:
+            logger.debug("no paths found between end nodes")
+            raise CenterlineError("no paths found between end nodes")
+        if logger.getEffectiveLevel() <= 10:
+            logger.debug("longest paths:")
+            for longest_path in longest_paths:
+                logger.debug(LineString(self.vertices[longest_path]))
+        return LineString(self.vertices[path])
+
+    def centerline(self, max_paths=5, smooth_sigma=5, stats=None):
+        """
+        Return centerline from skeleton.
+
+        Parameters:
+        -----------
+        max_paths : Number of longest paths used to create the centerlines.
+            (default: 5)
+        smooth_sigma : Smoothness of the output centerlines.
+            (default: 5)
+        stats : Optional CenterlineStats to record stage times and sizes.
+            (default: None)
+
+        Returns:
+        --------
+        geometry : LineString
+
+        Raises:
+        -------
+        CenterlineError : if no paths were found between end nodes
+
+        """
+        # smooth least curved path from the longest paths and return as
+        # LineString
+        path = self.path(max_paths, stats=stats)
+        with _stage(stats, "smoothing"):
+            centerline = _smooth_linestring(path, smooth_sigma)
+        if stats is not None:
+            stats.count(centerline_points=len(centerline.coords))
+        logger.debug("centerline: %s", centerline)
+        return centerline
+
+    def _voronoi_diagram(self):
+        """Return skeleton graph edges as MultiLineString."""
+        return MultiLineString(list(self.vertices[self.graph.nodes[self.graph.edges]]))
+
+
 # helper functions #
 ####################
 
 
+def _stage(stats, name):
+    """Return context measuring stage if stats are collected."""
+    return nullcontext() if stats is None else stats.stage(name)
+
+
 def _segmentize(geom, max_len):
     """Interpolate points on segments if they exceed maximum length."""
-    points = []
-    for previous, current in zip(geom.coords, geom.coords[1:]):
-        line_segment = LineString([previous, current])
-        # add points on line segment if necessary
-        points.extend(
-            [
-                line_segment.interpolate(max_len * i).coords[0]
-                for i in range(int(line_segment.length / max_len))
-            ]
-        )
-        # finally, add end point
-        points.append(current)
-    return LineString(points)
+    return LineString(_segmentize_coords(np.asarray(geom.coords), max_len))
+
+
+def _segmentize_within(geom, max_len, corridor):
+    """
+    Return coordinates of segmentized geom within corridor.
+
+    Segments with both end points outside of corridor are only segmentized
+    if they cross it, so outline parts away from corridor are not
+    interpolated just to be filtered out again.
+    """
+    coords = np.asarray(geom.coords)
+    inside = shapely.contains_xy(corridor, coords[:, 0], coords[:, 1])
+    starts, ends = coords[:-1], coords[1:]
+    lengths = np.sqrt(((ends - starts)[:, :2] ** 2).sum(axis=1))
+    # segments shorter than max_len get no points interpolated anyway
+    crossing = np.flatnonzero(~inside[:-1] & ~inside[1:] & (lengths >= max_len))
+    near = inside[:-1] | inside[1:]
+    near[crossing] = shapely.intersects(
+        corridor,
+        shapely.linestrings(np.stack([starts[crossing], ends[crossing]], axis=1)),
+    )
+    coords = _segmentize_coords(coords, np.where(near, max_len, np.inf))
+    return coords[shapely.contains_xy(corridor, coords[:, 0], coords[:, 1])]
+
+
+def _segmentize_coords(coords, max_len):
+    """
+    Return coordinates with points interpolated on segments exceeding max_len.
+
+    Every segment contributes its start point and points every max_len along
+    the segment if it is at least max_len long, followed by its end point.
+    max_len can also be an array with one maximum length per segment.
+    """
+    starts, ends = coords[:-1], coords[1:]
+    deltas = ends - starts
+    lengths = np.sqrt((deltas[:, :2] ** 2).sum(axis=1))
+    max_len = np.broadcast_to(max_len, lengths.shape)
+    counts = (lengths / max_len).astype(np.intp)
+
+    # segment index and step along segment for every output point, where the
+    # last step of every segment is its end point
+    segments = np.repeat(np.arange(len(starts)), counts + 1)
+    steps = np.arange(len(segments)) - np.repeat(
+        np.cumsum(counts + 1) - counts - 1, counts + 1
+    )
+    points = ends[segments]
+    inner = steps < counts[segments]
+    segments, steps = segments[inner], steps[inner]
+    points[inner] = (
+        starts[segments]
+        + (max_len[segments] * steps / lengths[segments])[:, np.newaxis]
+        * deltas[segments]
+    )
+    return points
+
+
+def _simplify_outline(outline, max_points, simplification):
+    """
+    Return outline points simplified to max_points and the tolerance used.
+
+    If the outline has too many points, the smallest multiple of the
+    simplification threshold (starting at twice the threshold) is searched
+    which simplifies the outline enough. The multiple is doubled until it is
+    sufficient and then bisected, so the number of simplification passes only
+    grows logarithmically with the tolerance required.
+    """
+    if len(outline.coords) <= max_points:
+        return outline.coords, 0.0
+    if simplification <= 0:
+        raise ValueError("simplification must be positive")
+
+    # a tolerance exceeding the outline extent cannot remove any more points
+    minx, miny, maxx, maxy = outline.bounds
+    max_factor = max(
+        2, math.ceil(math.hypot(maxx - minx, maxy - miny) / simplification)
+    )
+
+    def _simplify(factor):
+        points = outline.simplify(factor * simplification).coords
+        return points if len(points) <= max_points else None
+
+    low, high = 1, 2
+    points = _simplify(high)
+    while points is None:
+        if high == max_factor:
+            raise CenterlineError(
+                "outline cannot be simplified to %s points" % max_points
+            )
+        low, high = high, min(high * 2, max_factor)
+        points = _simplify(high)
+    while high - low > 1:
+        factor = (low + high) // 2
+        simplified = _simplify(factor)
+        if simplified is None:
+            low = factor
+        else:
+            high, points = factor, simplified
+    return points, high * simplification
 
 
 def _smooth_linestring(linestring, smooth_sigma):
@@ -154,82 +513,56 @@ def _smooth_linestring(linestring, smooth_sigma):
     )
 
 
-def _get_longest_paths(nodes, graph, max_paths):
-    """Return longest paths of all possible paths between a list of nodes."""
-
-    def _gen_paths_distances():
-        for node1, node2 in combinations(nodes, r=2):
-            try:
-                yield nx.single_source_dijkstra(
-                    G=graph, source=node1, target=node2, weight="weight"
-                )
-            except NetworkXNoPath:
-                continue
-
-    return [x for (y, x) in sorted(_gen_paths_distances(), reverse=True)][:max_paths]
-
-
 def _get_least_curved_path(paths, vertices):
     """Return path with smallest angles."""
-    return min(
-        zip([_get_path_angles_sum(path, vertices) for path in paths], paths),
-        key=operator.itemgetter(0),
-    )[1]
-
-
-def _get_path_angles_sum(path, vertices):
-    """Return all angles between edges from path."""
-    return sum(
-        [
-            _get_absolute_angle(
-                (vertices[pre], vertices[cur]), (vertices[cur], vertices[nex])
-            )
-            for pre, cur, nex in zip(path[:-1], path[1:], path[2:])
-        ]
-    )
+    return paths[int(np.argmin(_get_paths_angles_sums(paths, vertices)))]
 
 
-def _get_absolute_angle(edge1, edge2):
-    """Return absolute angle between edges."""
-    v1 = edge1[0] - edge1[1]
-    v2 = edge2[0] - edge2[1]
-    return abs(np.degrees(np.math.atan2(np.linalg.det([v1, v2]), np.dot(v1, v2))))
+def _get_paths_angles_sums(paths, vertices):
+    """Return sums of all angles between edges for every path."""
+    # score all paths at once by concatenating them and discarding the angles
+    # of vertex triples spanning two paths
+    path_ids = np.repeat(np.arange(len(paths)), [len(path) for path in paths])
+    angles = _get_absolute_angles(
+        vertices[np.concatenate(paths).astype(np.intp, copy=False)]
+    )
+    within = path_ids[:-2] == path_ids[2:]
+    return np.bincount(
+        path_ids[:-2][within], weights=angles[within], minlength=len(paths)
+    )
 
 
-def _get_end_nodes(graph):
-    """Return list of nodes with just one neighbor node."""
-    return [i for i in graph.nodes() if len(list(graph.neighbors(i))) == 1]
+def _get_absolute_angles(points):
+    """Return absolute angles in degrees between consecutive edges."""
+    v1 = points[:-2] - points[1:-1]
+    v2 = points[1:-1] - points[2:]
+    return np.abs(
+        np.degrees(
+            np.arctan2(
+                v1[:, 0] * v2[:, 1] - v1[:, 1] * v2[:, 0],
+                (v1 * v2).sum(axis=1),
+            )
+        )
+    )
 
 
 def _graph_from_voronoi(vor, geometry):
-    """Return networkx.Graph from Voronoi diagram within geometry."""
-    graph = nx.Graph()
-    for x, y, dist in _yield_ridge_vertices(vor, geometry, dist=True):
-        graph.add_nodes_from([x, y])
-        graph.add_edge(x, y, weight=dist)
-    return graph
-
-
-def _multilinestring_from_voronoi(vor, geometry):
-    """Return MultiLineString geometry from Voronoi diagram."""
-    return MultiLineString(
-        [
-            LineString([Point(vor.vertices[[x, y]][0]), Point(vor.vertices[[x, y]][1])])
-            for x, y in _yield_ridge_vertices(vor, geometry)
-        ]
-    )
+    """Return SkeletonGraph from Voronoi diagram within geometry."""
+    return SkeletonGraph(*_get_ridges_within(vor, geometry))
 
 
-def _yield_ridge_vertices(vor, geometry, dist=False):
-    """Yield Voronoi ridge vertices within geometry."""
-    for x, y in vor.ridge_vertices:
-        if x < 0 or y < 0:
-            continue
-        point1 = Point(vor.vertices[[x, y]][0])
-        point2 = Point(vor.vertices[[x, y]][1])
-        # Eliminate all points outside our geometry.
-        if point1.within(geometry) and point2.within(geometry):
-            if dist:
-                yield x, y, point1.distance(point2)
-            else:
-                yield x, y
+def _get_ridges_within(vor, geometry):
+    """
+    Return Voronoi ridge vertices within geometry and the ridge lengths.
+
+    Every Voronoi vertex is tested only once against the prepared geometry,
+    the ridges are then filtered by looking up the results of both vertices.
+    """
+    shapely.prepare(geometry)
+    within = shapely.contains_xy(geometry, vor.vertices[:, 0], vor.vertices[:, 1])
+    ridges = np.asarray(vor.ridge_vertices, dtype=np.intp).reshape(-1, 2)
+    # ridges reaching infinity are marked with a negative vertex index
+    ridges = ridges[(ridges >= 0).all(axis=1)]
+    ridges = ridges[within[ridges].all(axis=1)]
+    deltas = vor.vertices[ridges[:, 0]] - vor.vertices[ridges[:, 1]]
+    return ridges, np.sqrt((deltas**2).sum(axis=1))
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+import time
+
+
+class CenterlineStats:
+    """
+    Wall time and sizes of all centerline extraction stages.
+
+    Pass an instance as stats to get_centerline() or CenterlineSkeleton to
+    record how long every stage took and how large the intermediate results
+    were. For MultiPolygons, times and counts of all parts are summed up.
+
+    Diagnostic geometries (outline points, Voronoi diagram, longest paths)
+    are not built while extracting the centerline. Instead a function
+    creating them is stored and only called once diagnostic() is requested.
+
+    Parameters:
+    -----------
+    callback : Optional function called with the stage name and None when a
+        stage starts and with the stage name and elapsed seconds when it ends.
+
+    Attributes:
+    -----------
+    stages : Elapsed seconds per stage in order of execution.
+    counts : Sizes of intermediate results, e.g. number of Voronoi vertices.
+    tolerance : Largest simplification tolerance used.
+    """
+
+    STAGES = (
+        "segmentize",
+        "simplify",
+        "voronoi",
+        "rasterize",
+        "distance",
+        "skeletonize",
+        "graph",
+        "end_nodes",
+        "paths",
+        "smoothing",
+    )
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = {}
+        self.counts = {}
+        self.tolerance = 0.0
+        self._diagnostics = {}
+
+    def __repr__(self):
+        return "CenterlineStats(stages=%s, counts=%s)" % (self.stages, self.counts)
+
+    @property
+    def elapsed(self):
+        """Return total seconds spent in all stages."""
+        return sum(self.stages.values())
+
+    @contextmanager
+    def stage(self, name):
+        """Measure wall time of the code within the context as stage."""
+        if self.callback is not None:
+            self.callback(name, None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+    def count(self, **counts):
+        """Add sizes of intermediate results."""
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_diagnostic(self, name, factory):
+        """Register function creating a diagnostic geometry."""
+        self._diagnostics.setdefault(name, []).append(factory)
+
+    def diagnostics(self):
+        """Return names of available diagnostic geometries."""
+        return list(self._diagnostics)
+
+    def diagnostic(self, name):
+        """Return list of diagnostic geometries, one per Polygon part."""
+        return [factory() for factory in self._diagnostics[name]]
+
+    def as_dict(self):
+        """Return stage times and counts as dictionary."""
+        return dict(
+            stages=dict(self.stages),
+            counts=dict(self.counts),
+            tolerance=self.tolerance,
+            elapsed=self.elapsed,
+        )
@@ -0,0 +1,321 @@
+import concurrent.futures
+import logging
+import math
+import numpy as np
+import shapely
+from shapely.geometry import LineString, MultiLineString, Polygon
+from shapely.ops import split, substring
+
+from label_centerlines._src import (
+    CenterlineSkeleton,
+    _get_least_curved_path,
+    _smooth_linestring,
+    _stage,
+    get_centerline,
+)
+from label_centerlines.exceptions import CenterlineError
+
+logger = logging.getLogger(__name__)
+
+
+def _get_tiled_centerline(
+    geom, tile_length, tile_overlap=None, tile_workers=0, stats=None, **options
+):
+    """
+    Return centerline of a long Polygon from overlapping tiles.
+
+    A coarse centerline is extracted first as the longest path of the
+    whole outline resampled to max_points points. The Polygon is then cut
+    into tiles along the coarse centerline by chords across the Polygon
+    perpendicular to it, each tile overlapping its neighbors by
+    tile_overlap, so tiles follow meandering corridors. Centerlines of all
+    tiles are extracted independently at full resolution, clipped to the
+    non overlapping core of their tile and joined in order along the coarse
+    centerline. Tiles are shortened if their outline would exceed max_points
+    points at segmentize_maxlen.
+
+    The cut faces of a tile have skeleton branches to both of their corners,
+    which would make the straight paths across a cut face candidates for
+    the least curved path. The centerline of a tile is therefore only
+    searched between end nodes at opposite cut faces, or from the cut face
+    of the first and last tile to the end of the Polygon.
+
+    If the coarse centerline cannot be extracted, or the centerlines of two
+    tiles are joined by a segment leaving the Polygon by more than a tenth
+    of its mean width, e.g. across a failed tile, the centerline is
+    extracted from the whole Polygon instead.
+    """
+    if tile_overlap is None:
+        tile_overlap = tile_length / 4
+    if not 0 <= tile_overlap < tile_length:
+        raise ValueError("tile_overlap must be between 0 and tile_length")
+
+    try:
+        axis = _coarse_centerline(geom, stats=stats, **options)
+    except CenterlineError as e:
+        logger.info("coarse centerline failed, extract untiled: %s", e)
+        return get_centerline(geom, stats=stats, **options)
+    max_points = options.get("max_points", 3000)
+    # fewer vertices to locate centerline points along
+    axis = axis.simplify(geom.exterior.length / max_points)
+    step = tile_length - tile_overlap
+    # outlines of tiles exceeding max_points are simplified, which can split
+    # their skeleton, so tiles are shortened to fit
+    fitting = (
+        0.9
+        * max_points
+        * options.get("segmentize_maxlen", 0.5)
+        * axis.length
+        / geom.exterior.length
+        - tile_overlap
+    )
+    if 0 < fitting < step:
+        logger.debug("shorten tiles to %s to fit max_points", fitting + tile_overlap)
+        step = fitting
+    tiles = math.ceil(axis.length / step)
+    if tiles < 2:
+        return get_centerline(geom, stats=stats, **options)
+    bounds = np.linspace(0, axis.length, tiles + 1)
+    logger.debug("split Polygon into %s tiles along coarse centerline", tiles)
+
+    pieces = []
+    for tile, (low, high) in enumerate(zip(bounds[:-1], bounds[1:])):
+        # chords at the cut faces, the first and last tile are only cut on
+        # one side
+        cuts = (
+            None if tile == 0 else _chord(geom, axis, low - tile_overlap / 2),
+            None if tile == tiles - 1 else _chord(geom, axis, high + tile_overlap / 2),
+        )
+        piece = _piece(geom, cuts, axis, low, high)
+        if piece is not None:
+            pieces.append((tile, piece, cuts))
+
+    centerlines = [None] * tiles
+    if tile_workers == 0:
+        for tile, piece, cuts in pieces:
+            try:
+                centerlines[tile] = _get_tile_centerline(
+                    piece, cuts, stats=stats, **options
+                )
+            except CenterlineError as e:
+                logger.debug("tile error: %s", e)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(tile_workers) as executor:
+            futures = {
+                executor.submit(
+                    _tile_worker,
+                    shapely.to_wkb(piece),
+                    [None if c is None else shapely.to_wkb(c) for c in cuts],
+                    options,
+                ): tile
+                for tile, piece, cuts in pieces
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    centerlines[futures[future]] = shapely.from_wkb(future.result())
+                except CenterlineError as e:
+                    logger.debug("tile error: %s", e)
+
+    # clip centerlines to core of their tile by their position along the
+    # coarse centerline, the first and last tile are extended to catch the
+    # ends of the centerline
+    bounds[0], bounds[-1] = -np.inf, np.inf
+    parts = []
+    for centerline, low, high in zip(centerlines, bounds[:-1], bounds[1:]):
+        if centerline is None:
+            continue
+        part = _clip(centerline, axis, low, high, tile_length)
+        if part is not None:
+            parts.append(part)
+
+    if not parts:
+        raise CenterlineError("all tiles failed")
+    # parts are joined by straight segments, which leave the Polygon across
+    # failed tiles or where tiles took different ways
+    joins = shapely.linestrings(
+        [[previous[-1], part[0]] for previous, part in zip(parts[:-1], parts[1:])]
+    )
+    if len(joins) and (
+        shapely.length(shapely.difference(joins, geom)).max()
+        > geom.area / geom.length / 5
+    ):
+        logger.info("tiled centerline leaves Polygon, extract untiled")
+        return get_centerline(geom, stats=stats, **options)
+    return LineString(np.concatenate(parts))
+
+
+def _coarse_centerline(
+    geom, max_points=3000, simplification=0.05, smooth_sigma=5, stats=None, **kwargs
+):
+    """
+    Return longest path of outline resampled to max_points evenly spaced points.
+
+    Evenly spaced points keep the skeleton connected, unlike simplifying the
+    outline, which leaves long segments without points. The longest path is
+    used instead of the least curved of several paths, which can be a short
+    straight path between close end nodes.
+    """
+    resolution = geom.exterior.length / max_points
+    outline = Polygon(
+        shapely.get_coordinates(
+            shapely.line_interpolate_point(
+                geom.exterior, np.arange(max_points) * resolution
+            )
+        ),
+        # skeleton edges across holes are removed
+        holes=geom.interiors,
+    )
+    # outline segments are shorter than twice the resolution, so they are
+    # not segmentized again
+    return CenterlineSkeleton(
+        outline, 2 * resolution, max_points, simplification, stats=stats
+    ).centerline(1, smooth_sigma, stats=stats)
+
+
+def _chord(geom, axis, distance):
+    """Return chord across Polygon perpendicular to axis at distance."""
+    distance = min(max(distance, 0), axis.length)
+    point = np.asarray(axis.interpolate(distance).coords[0])
+    before = np.asarray(axis.interpolate(max(distance - 1, 0)).coords[0])
+    after = np.asarray(axis.interpolate(min(distance + 1, axis.length)).coords[0])
+    direction = after - before
+    normal = np.array([-direction[1], direction[0]]) / np.hypot(*direction)
+    # long enough to cross the Polygon anywhere
+    reach = math.hypot(*np.subtract(geom.bounds[2:], geom.bounds[:2]))
+    line = LineString([point - reach * normal, point + reach * normal])
+    # holes are crossed, so the chord separates the Polygon around them
+    crossing = line.intersection(Polygon(geom.exterior))
+    parts = [p for p in getattr(crossing, "geoms", [crossing]) if p.length]
+    if not parts:
+        return None
+    # only the part across the corridor at point, not other corridor parts
+    # the line crosses further away
+    chord = min(parts, key=lambda p: p.distance(shapely.Point(point)))
+    # extend beyond the outline so splitting does not depend on rounding
+    start, end = np.asarray(chord.coords[0]), np.asarray(chord.coords[-1])
+    extension = (end - start) / chord.length * geom.length * 1e-6
+    return LineString([start - extension, end + extension])
+
+
+def _piece(geom, cuts, axis, low, high):
+    """Return part of Polygon between cuts containing the middle of the tile."""
+    cuts = [c for c in cuts if c is not None]
+    parts = split(geom, MultiLineString(cuts)).geoms if cuts else [geom]
+    middle = axis.interpolate((low + high) / 2)
+    parts = [p for p in parts if p.area > 0]
+    if not parts:
+        return None
+    return min(parts, key=lambda p: p.distance(middle))
+
+
+def _clip(centerline, axis, low, high, reach):
+    """
+    Return coordinates of longest run of centerline between low and high.
+
+    Positions are measured along axis and the run is oriented along it. Only
+    the part of axis up to reach beyond low and high is searched for the
+    positions.
+    """
+    coords = np.asarray(centerline.coords)[:, :2]
+    start = max(low - reach, 0)
+    positions = start + shapely.line_locate_point(
+        substring(axis, start, min(high + reach, axis.length)), shapely.points(coords)
+    )
+    inside = np.concatenate(
+        [[False], (positions >= low) & (positions <= high), [False]]
+    )
+    # starts and ends of runs of consecutive points within the core
+    changes = np.flatnonzero(inside[1:] != inside[:-1])
+    if not len(changes):
+        return None
+    starts, ends = changes[::2], changes[1::2]
+    longest = np.argmax(ends - starts)
+    part = coords[starts[longest] : ends[longest]]
+    if len(part) < 2:
+        return None
+    if positions[starts[longest]] > positions[ends[longest] - 1]:
+        part = part[::-1]
+    return part
+
+
+def _get_tile_centerline(
+    piece,
+    cuts,
+    segmentize_maxlen=0.5,
+    max_points=3000,
+    simplification=0.05,
+    smooth_sigma=5,
+    max_paths=5,
+    engine="voronoi",
+    stats=None,
+    **kwargs,
+):
+    """
+    Return centerline of tile connecting its cut faces.
+
+    cuts are the chords of the cut faces at the start and the end of the
+    tile or None. End nodes closer to a cut face than about the width of
+    the piece count as on the cut face. If no path connects the cut faces, for example
+    because the skeleton of the tile is split, the longest paths between
+    the other end nodes are used. Other engines than "voronoi" extract the
+    centerline of the whole piece.
+    """
+    if engine != "voronoi":
+        return get_centerline(
+            piece,
+            segmentize_maxlen=segmentize_maxlen,
+            max_points=max_points,
+            simplification=simplification,
+            smooth_sigma=smooth_sigma,
+            max_paths=max_paths,
+            engine=engine,
+            stats=stats,
+            **kwargs,
+        )
+    skeleton = CenterlineSkeleton(
+        piece, segmentize_maxlen, max_points, simplification, stats=stats
+    )
+    end_nodes = skeleton.end_nodes
+    points = shapely.points(skeleton.vertices[end_nodes])
+    tolerance = 2 * piece.area / piece.exterior.length
+    low_cut, high_cut = cuts
+    low = np.zeros(len(end_nodes), dtype=bool)
+    high = np.zeros(len(end_nodes), dtype=bool)
+    if low_cut is not None:
+        low = shapely.distance(low_cut, points) <= tolerance
+    if high_cut is not None:
+        high = (shapely.distance(high_cut, points) <= tolerance) & ~low
+    cut = low | high
+    if not cut.any():
+        return skeleton.centerline(max_paths, smooth_sigma, stats=stats)
+
+    with _stage(stats, "paths"):
+        if low.any() and high.any():
+            paths = skeleton.graph.longest_paths_between(
+                end_nodes[low], end_nodes[high], max_paths
+            )
+        else:
+            paths = skeleton.graph.longest_paths_between(
+                end_nodes[cut], end_nodes[~cut], max_paths
+            )
+        if not paths:
+            paths = skeleton.graph.longest_paths(end_nodes[~cut], max_paths)
+        if paths:
+            path = _get_least_curved_path(paths, skeleton.vertices)
+    if stats is not None:
+        stats.count(longest_paths=len(paths))
+    if not paths:
+        raise CenterlineError("no paths found")
+    with _stage(stats, "smoothing"):
+        centerline = _smooth_linestring(
+            LineString(skeleton.vertices[path]), smooth_sigma
+        )
+    if stats is not None:
+        stats.count(centerline_points=len(centerline.coords))
+    return centerline
+
+
+def _tile_worker(wkb, cuts, options):
+    """Return centerline WKB of tile from WKB of tile and cut faces."""
+    cuts = [None if cut is None else shapely.from_wkb(cut) for cut in cuts]
+    return shapely.to_wkb(_get_tile_centerline(shapely.from_wkb(wkb), cuts, **options))
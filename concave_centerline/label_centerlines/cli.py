@@ -1,13 +1,39 @@
+"""
+Command line interface extracting centerlines and merging outputs.
+
+Usage:
+
+    python -m label_centerlines.cli extract input.gpkg output.gpkg
+    python -m label_centerlines.cli merge shard_0.gpkg shard_1.gpkg output.gpkg
+"""
+
 import click
 import concurrent.futures
 from contextlib import ExitStack
 import fiona
+import itertools
+import json
 import logging
+import os
+import queue
+import shapely
 from shapely.geometry import shape, mapping
+import threading
 import time
 import tqdm
+import zlib
 
-from label_centerlines import __version__, get_centerline
+from label_centerlines import (
+    __version__,
+    CenterlineCache,
+    CenterlineStats,
+    get_centerline,
+)
+from label_centerlines._batch import _as_completed
+from label_centerlines._diff import _Diff
+from label_centerlines._pool import _GuardedPool, _Killed, _report_stage
+from label_centerlines._report import _RunReport
+from label_centerlines._schedule import _CostModel, _lpt_chunks
 from label_centerlines.exceptions import CenterlineError
 
 
@@ -31,6 +57,114 @@ logging.getLogger().addHandler(stream_handler)
 logger = logging.getLogger(__name__)
 
 
+class _Writer(threading.Thread):
+    """
+    Thread writing records to the output in batches.
+
+    Records are passed through a bounded queue, so collecting results only
+    waits for the writer if the queue is full. Queued records are written
+    with one call of write, e.g. fiona's writerecords() which uses one
+    transaction, per batch of up to batch_size records. write flushes the
+    records to disk and returns the number of features written. Afterwards
+    the IDs of the input features the records were created from are appended
+    to the journal, so features are only journaled once their records are
+    written.
+    """
+
+    def __init__(self, write, journal, batch_size=1000, queue_size=64):
+        threading.Thread.__init__(self, name="writer", daemon=True)
+        self._write = write
+        self.journal = journal
+        self.batch_size = batch_size
+        self.written = 0
+        # seconds spent writing, waiting for records and waiting for the
+        # writer to accept records
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+
+    def write(self, records, ids):
+        """Queue list of records and IDs of their input features."""
+        start = time.perf_counter()
+        while self.is_alive():
+            try:
+                self._queue.put((records, ids), timeout=1)
+                break
+            except queue.Full:
+                pass
+        self.blocked += time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Write all queued records and wait for the thread to finish."""
+        if self.is_alive():
+            self._queue.put(None)
+            self.join()
+        logger.info(
+            "writer: %s features, %.3fs busy, %.3fs waiting for results, "
+            "%.3fs blocking result collection",
+            self.written,
+            self.busy,
+            self.idle,
+            self.blocked,
+        )
+        if self._error is not None:
+            raise self._error
+
+    def run(self):
+        finished = False
+        while not finished:
+            start = time.perf_counter()
+            item = self._queue.get()
+            self.idle += time.perf_counter() - start
+            if item is None:
+                break
+            batch, ids = list(item[0]), list(item[1])
+            # take everything already queued up to batch_size records
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.extend(item[0])
+                ids.extend(item[1])
+            start = time.perf_counter()
+            try:
+                if batch:
+                    self.written += self._write(batch)
+                self.journal.writelines("%s\n" % id_ for id_ in ids)
+                self.journal.flush()
+            except Exception as e:
+                self._error = e
+                break
+            self.busy += time.perf_counter() - start
+
+
+def _parse_shard(ctx, param, value):
+    """Return shard index and number of shards from "i/n"."""
+    if value is None:
+        return None
+    try:
+        index, shards = map(int, value.split("/"))
+    except ValueError:
+        raise click.BadParameter("must be i/n, e.g. 0/4")
+    if not 0 <= index < shards:
+        raise click.BadParameter("i must be between 0 and n - 1")
+    return index, shards
+
+
+def _in_shard(feature_id, shard):
+    """Return whether feature belongs to shard by a stable hash of its ID."""
+    index, shards = shard
+    return zlib.crc32(str(feature_id).encode()) % shards == index
+
+
 @click.command()
 @click.version_option(version=__version__, message="%(version)s")
 @click.argument("input_path")
@@ -67,10 +201,122 @@ logger = logging.getLogger(__name__)
 )
 @click.option(
     "--output_driver",
-    type=click.Choice(["GeoJSON", "GPKG"]),
-    help="Output format. " "(default: 'GeoJSON')",
+    type=click.Choice(["GeoJSON", "GPKG", "Parquet"]),
+    help="Output format, Parquet writes GeoParquet and requires --io arrow. "
+    "(default: 'GeoJSON')",
     default="GeoJSON",
 )
+@click.option(
+    "--io",
+    type=click.Choice(["fiona", "arrow"]),
+    help="Read and write features one by one with fiona or as Arrow record "
+    "batches with pyogrio and pyarrow, which also reads *.parquet input as "
+    "GeoParquet. (default: 'fiona')",
+    default="fiona",
+)
+@click.option(
+    "--cache",
+    type=click.Path(dir_okay=False),
+    help="SQLite file caching centerlines of unchanged features between runs.",
+)
+@click.option(
+    "--cache_size",
+    type=int,
+    help="Maximum size of cached centerlines in MB. " "(default: 1024)",
+    default=1024,
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    help="Number of worker processes. (default: number of CPUs)",
+)
+@click.option(
+    "--max_in_flight",
+    type=click.IntRange(min=1),
+    help="Maximum number of feature chunks read and queued for the workers "
+    "while results are written. (default: 4 times the number of workers)",
+)
+@click.option(
+    "--chunk_size",
+    type=click.IntRange(min=1),
+    help="Number of features sent to a worker at once. " "(default: 16)",
+    default=16,
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip features listed in the journal of a previous run and append "
+    "to its output. Requires --output_driver GPKG.",
+)
+@click.option(
+    "--shard",
+    callback=_parse_shard,
+    help="Only process shard i of n disjoint shards, e.g. 0/4, determined "
+    "by a hash of the feature IDs.",
+)
+@click.option(
+    "--bbox",
+    type=float,
+    nargs=4,
+    help="Only process features intersecting bounding box " "(left bottom right top).",
+)
+@click.option(
+    "--where",
+    help="Only process features matching OGR SQL attribute filter.",
+)
+@click.option(
+    "--id_field",
+    help="Attribute identifying features, used instead of feature IDs for "
+    "the journal, shards and --previous_input.",
+)
+@click.option(
+    "--previous_input",
+    help="Previous version of the input, only features added or with "
+    "changed geometries since are extracted. Requires --previous_output and "
+    "--id_field.",
+)
+@click.option(
+    "--previous_output",
+    help="Output of --previous_input, centerlines of unchanged features are "
+    "copied from it.",
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Kill workers spending more than this many seconds on one feature.",
+)
+@click.option(
+    "--max_memory",
+    type=click.IntRange(min=1),
+    help="Kill workers using more than this many MB of memory.",
+)
+@click.option(
+    "--schedule",
+    type=click.Choice(["input", "cost"]),
+    help="Send features to the workers in input order or the most expensive "
+    "ones by an estimate from their size first. (default: 'input')",
+    default="input",
+)
+@click.option(
+    "--schedule_window",
+    type=click.IntRange(min=1),
+    help="Number of features read ahead and ordered by --schedule cost. "
+    "(default: 10000)",
+    default=10000,
+)
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False),
+    help="Write elapsed time, stage times, sizes and errors of all features "
+    "and a summary of the run to a JSON or, if ending with .parquet, "
+    "Parquet file.",
+)
+@click.option(
+    "--report_slowest",
+    type=click.IntRange(min=0),
+    help="Number of slowest features listed in the report summary. " "(default: 10)",
+    default=10,
+)
 @click.option("--verbose", is_flag=True, help="show information on processed features")
 @click.option("--debug", is_flag=True, help="show debug log messages")
 def main(
@@ -82,6 +328,25 @@ def main(
     smooth,
     max_paths,
     output_driver,
+    io,
+    cache,
+    cache_size,
+    workers,
+    max_in_flight,
+    chunk_size,
+    resume,
+    shard,
+    bbox,
+    where,
+    id_field,
+    previous_input,
+    previous_output,
+    timeout,
+    max_memory,
+    schedule,
+    schedule_window,
+    report,
+    report_slowest,
     verbose,
     debug,
 ):
@@ -91,78 +356,569 @@ def main(
     Multipart features (MultiPolygons) from input will be converted to
     singlepart features, i.e. all output features written will be LineString
     geometries, not MultiLineString geometries.
+
+    IDs of all finished input features are written to a journal next to the
+    output (OUTPUT_PATH.journal), so an interrupted run can be continued
+    with --resume. Features written just before the interruption may be
+    written again. Only GPKG outputs can be resumed, as GeoJSON files are
+    left incomplete by an interruption and GeoParquet files cannot be
+    appended to.
+
+    Features exceeding --timeout or --max_memory are skipped and listed in
+    OUTPUT_PATH.failures together with their properties, the reason and the
+    stage reached. With these limits, features whose worker process dies,
+    e.g. by the OOM killer, are skipped the same way.
+
+    With --schedule cost, the cost of features is estimated from their
+    number of vertices, perimeter and area. Within every --schedule_window
+    features, the most expensive ones are sent first and alone, the cheap
+    ones last in chunks, so a few large features do not keep one worker busy
+    after all others are finished. Predicted and measured times are logged
+    to calibrate the estimate.
+
+    With --previous_input and --previous_output, features are matched with
+    the previous input by --id_field. Centerlines of features with the same
+    geometry are copied from the previous output after all other features
+    are extracted, without reading their geometries. Both inputs should be
+    read the same way, i.e. with the same --io, as geometries are compared
+    by their WKB.
     """
     # set up logger
     log_level = logging.DEBUG if debug else logging.INFO
     logging.getLogger("label_centerlines").setLevel(log_level)
     stream_handler.setLevel(log_level)
 
+    if output_driver == "Parquet" and io != "arrow":
+        raise click.UsageError("Parquet output requires --io arrow")
+    if resume and output_driver != "GPKG":
+        raise click.UsageError("--resume requires --output_driver GPKG")
+    if (previous_input is None) != (previous_output is None):
+        raise click.UsageError(
+            "--previous_input and --previous_output must be used together"
+        )
+    if previous_input is not None:
+        if id_field is None:
+            raise click.UsageError("--previous_input requires --id_field")
+        if os.path.abspath(previous_output) == os.path.abspath(output_path):
+            raise click.UsageError("output must not overwrite --previous_output")
+
+    with ExitStack() as es:
+        journal_path = output_path + ".journal"
+        finished = set()
+        append = resume and os.path.exists(output_path)
+        if append:
+            if os.path.exists(journal_path):
+                with open(journal_path) as journal:
+                    finished.update(line.strip() for line in journal)
+            logger.info("resume after %s finished features", len(finished))
+
+        # set up context managers for input & output, chunks are tuples of
+        # feature IDs, attributes and WKB geometries
+        if io == "arrow":
+            import pyarrow as pa
+
+            from label_centerlines._arrow import (
+                _ArrowSink,
+                _centerline_batch,
+                _read_arrow,
+            )
+
+            crs, total, batches = es.enter_context(
+                _read_arrow(input_path, chunk_size, bbox=bbox or None, where=where)
+            )
+            sink = _ArrowSink(output_path, output_driver, crs=crs, append=append)
+            es.callback(sink.close)
+            write = sink.write
+
+            def _chunks():
+                for ids, attributes, geometries in batches:
+                    if id_field is not None:
+                        ids = _field_ids(attributes)
+                    properties = attributes.to_pylist() if diff is not None else None
+                    rows = [
+                        row
+                        for row, feature_id in enumerate(ids)
+                        if feature_id not in finished
+                        and not (shard and not _in_shard(feature_id, shard))
+                        and not (
+                            diff is not None
+                            and diff.unchanged(
+                                feature_id, geometries[row], properties[row]
+                            )
+                        )
+                    ]
+                    if len(rows) < len(ids):
+                        ids, attributes = _subset(ids, attributes, rows)
+                        geometries = [geometries[row] for row in rows]
+                    if ids:
+                        yield ids, attributes, geometries
+
+            def _subset(ids, attributes, rows):
+                return (
+                    [ids[row] for row in rows],
+                    attributes.take(pa.array(rows, type=pa.int64())),
+                )
+
+            def _field_ids(attributes):
+                if id_field not in attributes.schema.names:
+                    raise click.UsageError("no attribute %s" % id_field)
+                return [str(i) for i in attributes.column(id_field).to_pylist()]
+
+            def _schema(path):
+                # schema of the attributes of the first batch
+                with _read_arrow(path, 1) as (_, _, first):
+                    return next((b[1].schema for b in first), None)
+
+            def _attribute_names(path):
+                schema = _schema(path)
+                return None if schema is None else schema.names
+
+            def _previous_features():
+                with _read_arrow(previous_input, 10000) as (_, _, previous):
+                    for _, attributes, geometries in previous:
+                        yield from zip(
+                            _field_ids(attributes), geometries, attributes.to_pylist()
+                        )
+
+            def _copied():
+                # attributes are cast to the schema of the input, so copied
+                # and extracted centerlines can be written together
+                schema = _schema(input_path)
+                with _read_arrow(previous_output, 10000) as (_, _, previous):
+                    for _, attributes, geometries in previous:
+                        ids = _field_ids(attributes)
+                        copied, updated = [], []
+                        for row, feature_id in enumerate(ids):
+                            if feature_id in finished:
+                                continue
+                            if feature_id in diff.copied:
+                                copied.append(row)
+                            elif feature_id in diff.updated:
+                                updated.append(row)
+                        records = []
+                        if copied:
+                            batch = (
+                                pa.Table.from_batches(
+                                    [attributes.take(pa.array(copied, type=pa.int64()))]
+                                )
+                                .select(schema.names)
+                                .cast(schema)
+                                .to_batches()[0]
+                            )
+                            records.append(_with_geometries(batch, geometries, copied))
+                        if updated:
+                            batch = pa.RecordBatch.from_pylist(
+                                [diff.updated[ids[row]] for row in updated],
+                                schema=schema,
+                            )
+                            records.append(_with_geometries(batch, geometries, updated))
+                        if records:
+                            yield records, [ids[row] for row in copied + updated]
+
+            def _with_geometries(batch, geometries, rows):
+                # WKB is copied as it is
+                return batch.append_column(
+                    "geometry",
+                    pa.array([geometries[row] for row in rows], type=pa.binary()),
+                )
+
+            def _concat(chunks):
+                table = pa.Table.from_batches([c[1] for c in chunks])
+                return (
+                    [i for c in chunks for i in c[0]],
+                    table.combine_chunks().to_batches()[0],
+                    [g for c in chunks for g in c[2]],
+                )
+
+            def _records(ids, attributes, results):
+                return [_centerline_batch(attributes, results)]
+
+            def _describe(ids, attributes, row):
+                return "%s" % ids[row]
+
+            def _properties(ids, attributes, row):
+                return attributes.slice(row, 1).to_pylist()[0]
+
+        else:
+            src = es.enter_context(fiona.open(input_path, "r"))
+            if append:
+                dst = es.enter_context(fiona.open(output_path, "a"))
+            else:
+                dst = es.enter_context(
+                    fiona.open(
+                        output_path,
+                        "w",
+                        schema=dict(src.schema.copy(), geometry="LineString"),
+                        crs=src.crs,
+                        driver=output_driver,
+                    )
+                )
+            total = len(src)
+
+            def write(records):
+                dst.writerecords(records)
+                # records must be on disk before their IDs are journaled
+                dst.flush()
+                return len(records)
+
+            def _chunks():
+                # bbox and where filters are applied by OGR while reading
+                ids, properties, geometries = [], [], []
+                for feature in src.filter(bbox=bbox or None, where=where):
+                    feature_id = str(
+                        feature["id"]
+                        if id_field is None
+                        else feature["properties"][id_field]
+                    )
+                    if feature_id in finished:
+                        continue
+                    if shard and not _in_shard(feature_id, shard):
+                        continue
+                    wkb = shapely.to_wkb(shape(feature["geometry"]))
+                    if diff is not None and diff.unchanged(
+                        feature_id, wkb, feature["properties"]
+                    ):
+                        continue
+                    ids.append(feature_id)
+                    properties.append(feature["properties"])
+                    geometries.append(wkb)
+                    if len(ids) == chunk_size:
+                        yield ids, properties, geometries
+                        ids, properties, geometries = [], [], []
+                if ids:
+                    yield ids, properties, geometries
+
+            def _subset(ids, properties, rows):
+                return [ids[row] for row in rows], [properties[row] for row in rows]
+
+            def _previous_features():
+                with fiona.open(previous_input) as previous:
+                    for feature in previous:
+                        yield (
+                            str(feature["properties"][id_field]),
+                            shapely.to_wkb(shape(feature["geometry"])),
+                            feature["properties"],
+                        )
+
+            def _copied():
+                # records are passed on as read, so geometries are not parsed
+                with fiona.open(previous_output) as previous:
+                    features = iter(previous)
+                    while True:
+                        batch = list(itertools.islice(features, 1000))
+                        if not batch:
+                            break
+                        records, ids = [], []
+                        for feature in batch:
+                            feature_id = str(feature["properties"][id_field])
+                            if feature_id in finished:
+                                continue
+                            if feature_id in diff.copied:
+                                records.append(feature)
+                            elif feature_id in diff.updated:
+                                records.append(
+                                    dict(
+                                        geometry=feature["geometry"],
+                                        properties=diff.updated[feature_id],
+                                    )
+                                )
+                            else:
+                                continue
+                            ids.append(feature_id)
+                        if records:
+                            yield records, ids
+
+            def _concat(chunks):
+                return tuple([x for c in chunks for x in c[i]] for i in range(3))
+
+            def _records(ids, properties, results):
+                # output is split up into parts of single part geometries to
+                # meet GeoPackage requirements
+                return [
+                    dict(geometry=mapping(part), properties=properties[row])
+                    for row, wkb, *_ in results
+                    if wkb is not None
+                    for part in shapely.get_parts(shapely.from_wkb(wkb))
+                ]
+
+            def _describe(ids, properties, row):
+                return properties[row]
+
+            def _properties(ids, properties, row):
+                return dict(properties[row])
+
+            def _attribute_names(path):
+                with fiona.open(path) as collection:
+                    return list(collection.schema["properties"])
+
+        diff = None
+        if previous_input is not None:
+            if _attribute_names(previous_output) != _attribute_names(input_path):
+                raise click.UsageError(
+                    "attributes of --previous_output differ from the input"
+                )
+            diff = _Diff(_previous_features())
+
+        journal = es.enter_context(open(journal_path, "a" if append else "w"))
+        if timeout or max_memory:
+            # workers exceeding the limits are killed and replaced, which is
+            # not possible with ProcessPoolExecutor
+            executor = es.enter_context(
+                _GuardedPool(
+                    workers=workers,
+                    timeout=timeout,
+                    max_rss=max_memory * 2**20 if max_memory else None,
+                )
+            )
+            worker = _feature_worker
+            failures = es.enter_context(
+                open(output_path + ".failures", "a" if append else "w")
+            )
+        else:
+            executor = es.enter_context(concurrent.futures.ProcessPoolExecutor(workers))
+            worker = _chunk_worker
+        workers = workers or os.cpu_count()
+        if cache:
+            cache = CenterlineCache(cache, max_size=cache_size * 2**20)
+            es.callback(cache.close)
+        writer = _Writer(write, journal)
+        writer.start()
+        es.callback(writer.close)
+
+        # chunks are sent to the workers as WKB geometries while their IDs
+        # and attributes stay here, features are only read from input as
+        # fast as results are written, so memory use does not depend on the
+        # number of input features
+        options = dict(
+            segmentize_maxlen=segmentize_maxlen,
+            max_points=max_points,
+            simplification=simplification,
+            smooth_sigma=smooth,
+            max_paths=max_paths,
+            cache=cache,
+        )
+        if report:
+            report = _RunReport(
+                report,
+                slowest=report_slowest,
+                version=__version__,
+                input_path=input_path,
+                parameters=dict(
+                    {k: v for k, v in options.items() if k != "cache"},
+                    io=io,
+                    workers=workers,
+                    chunk_size=chunk_size,
+                    schedule=schedule,
+                ),
+            )
+            es.callback(report.close)
+        pending = {}
+        cost_model = _CostModel(segmentize_maxlen, max_points)
+
+        def _scheduled(chunks):
+            # ordering all features would require reading all of them first,
+            # so they are only ordered within windows
+            while True:
+                window = list(
+                    itertools.islice(chunks, max(1, schedule_window // chunk_size))
+                )
+                if not window:
+                    break
+                ids, attributes, geometries = _concat(window)
+                terms = cost_model.terms(geometries)
+                costs = cost_model.predict(terms)
+                target = costs.sum() / (4 * workers)
+                for rows in _lpt_chunks(costs, chunk_size, target):
+                    yield (
+                        *_subset(ids, attributes, rows),
+                        [geometries[row] for row in rows],
+                        terms[rows],
+                    )
+
+        def _tasks():
+            if schedule == "cost":
+                chunks = _scheduled(_chunks())
+            else:
+                chunks = ((*chunk, None) for chunk in _chunks())
+            for task, (ids, attributes, geometries, terms) in enumerate(chunks):
+                pending[task] = ids, attributes, terms
+                yield task, (list(enumerate(geometries)), options)
+
+        # the number of filtered features is unknown before reading them
+        if shard or bbox or where or diff is not None or total is None:
+            total = None
+        else:
+            total -= len(finished)
+        with tqdm.tqdm(disable=debug, total=total) as progress:
+            for task, future in _as_completed(
+                executor,
+                worker,
+                _tasks(),
+                max_in_flight or 4 * workers,
+            ):
+                ids, attributes, terms = pending.pop(task)
+                results = future.result()
+                killed = set()
+                for i, result in enumerate(results):
+                    if isinstance(result, _Killed):
+                        killed.add(i)
+                        row = result.item[0]
+                        failures.write(
+                            json.dumps(
+                                dict(
+                                    id=ids[row],
+                                    properties=_properties(ids, attributes, row),
+                                    reason=result.reason,
+                                    stage=result.stage,
+                                    elapsed=round(result.elapsed, 3),
+                                ),
+                                default=str,
+                            )
+                            + "\n"
+                        )
+                        failures.flush()
+                        results[i] = (
+                            row,
+                            None,
+                            round(result.elapsed, 3),
+                            dict(pid=None, error=result.reason, stats=None),
+                        )
+                for row, wkb, elapsed, info in results:
+                    if report is not None:
+                        report.add(ids[row], elapsed, info)
+                    if wkb is None:
+                        logger.error(
+                            "centerline could not be extracted from feature %s",
+                            _describe(ids, attributes, row),
+                        )
+                    if verbose:
+                        tqdm.tqdm.write(
+                            "%ss: %s" % (elapsed, _describe(ids, attributes, row))
+                        )
+                if terms is not None:
+                    _observe(cost_model, ids, terms, results, killed)
+                writer.write(_records(ids, attributes, results), ids)
+                progress.update(len(results))
+        if diff is not None:
+            for records, ids in _copied():
+                writer.write(records, ids)
+            diff.summary()
+        if schedule == "cost":
+            cost_model.summary()
+
+
+def _observe(cost_model, ids, terms, results, killed):
+    """Pass measured times of a chunk to the cost model and log them."""
+    # times of killed features only tell the limit
+    rows = [i for i in range(len(results)) if i not in killed]
+    if not rows:
+        return
+    elapsed = [results[i][2] for i in rows]
+    cost_model.observe(terms[rows], elapsed)
+    for feature_id, predicted, seconds in zip(
+        [ids[results[i][0]] for i in rows], cost_model.predict(terms[rows]), elapsed
+    ):
+        logger.debug(
+            "feature %s: %.3fs predicted, %.3fs measured",
+            feature_id,
+            predicted,
+            seconds,
+        )
+
+
+def _chunk_worker(chunk, options):
+    """Return index, centerline WKB or None, elapsed time and info of features."""
+    return [_feature_worker(item, options) for item in chunk]
+
+
+def _feature_worker(item, options):
+    """
+    Return index, centerline WKB or None, elapsed time and info of feature.
+
+    info is a dictionary of the worker "pid", the "error" class name or None
+    and "stats" as returned by CenterlineStats.as_dict().
+    """
+    index, wkb = item
+    start = time.time()
+    # report stages to a _GuardedPool supervisor if there is one
+    stats = CenterlineStats(
+        callback=lambda stage, elapsed: elapsed is None and _report_stage(stage)
+    )
+    error = None
+    try:
+        centerline = shapely.to_wkb(
+            get_centerline(shapely.from_wkb(wkb), stats=stats, **options)
+        )
+    except CenterlineError as e:
+        centerline = None
+        error = type(e).__name__
+    return (
+        index,
+        centerline,
+        round(time.time() - start, 3),
+        dict(pid=os.getpid(), error=error, stats=stats.as_dict()),
+    )
+
+
+@click.command()
+@click.version_option(version=__version__, message="%(version)s")
+@click.argument("input_paths", nargs=-1, required=True)
+@click.argument("output_path")
+@click.option(
+    "--output_driver",
+    type=click.Choice(["GeoJSON", "GPKG"]),
+    help="Output format. " "(default: 'GeoJSON')",
+    default="GeoJSON",
+)
+@click.option(
+    "--batch_size",
+    type=click.IntRange(min=1),
+    help="Number of features written in one transaction. " "(default: 10000)",
+    default=10000,
+)
+def merge(input_paths, output_path, output_driver, batch_size):
+    """
+    Concatenate outputs of several runs into one output.
+
+    Outputs of all shards of a --shard run can be merged this way. All
+    inputs must have the same schema.
+    """
     with ExitStack() as es:
-        # set up context managers for fiona & process pool
-        src = es.enter_context(fiona.open(input_path, "r"))
+        sources = [es.enter_context(fiona.open(path, "r")) for path in input_paths]
+        schema = sources[0].schema
+        for src in sources[1:]:
+            if src.schema != schema:
+                raise click.UsageError(
+                    "schema of %s differs from %s" % (src.path, sources[0].path)
+                )
         dst = es.enter_context(
             fiona.open(
                 output_path,
                 "w",
-                schema=dict(src.schema.copy(), geometry="LineString"),
-                crs=src.crs,
+                schema=schema,
+                crs=sources[0].crs,
                 driver=output_driver,
             )
         )
-        executor = es.enter_context(concurrent.futures.ProcessPoolExecutor())
-
-        tasks = (
-            executor.submit(
-                _feature_worker,
-                feature,
-                segmentize_maxlen,
-                max_points,
-                simplification,
-                smooth,
-                max_paths,
-            )
-            for feature in src
-        )
-        for task in tqdm.tqdm(
-            concurrent.futures.as_completed(tasks), disable=debug, total=len(src)
-        ):
-            # output is split up into parts of single part geometries to meet
-            # GeoPackage requirements
-            for part in task.result():
-                feature, elapsed = part
-                if "geometry" in feature:
-                    dst.write(feature)
-                else:
-                    logger.error(
-                        "centerline could not be extracted from feature %s",
-                        feature["properties"],
-                    )
-                if verbose:
-                    tqdm.tqdm.write("%ss: %s" % (elapsed, feature["properties"]))
+        for src in sources:
+            features = iter(src)
+            while True:
+                batch = list(itertools.islice(features, batch_size))
+                if not batch:
+                    break
+                dst.writerecords(batch)
+            logger.info("merged %s features from %s", len(src), src.path)
 
 
-def _feature_worker(
-    feature, segmentize_maxlen, max_points, simplification, smooth, max_paths
-):
-    try:
-        start = time.time()
-        centerline = get_centerline(
-            shape(feature["geometry"]),
-            segmentize_maxlen,
-            max_points,
-            simplification,
-            smooth,
-            max_paths,
-        )
-    except CenterlineError:
-        return [(dict(properties=feature["properties"]), round(time.time() - start, 3))]
-    finally:
-        elapsed = round(time.time() - start, 3)
-
-    if centerline.geom_type == "LineString":
-        return [(dict(feature, geometry=mapping(centerline)), elapsed)]
-    elif centerline.geom_type == "MultiLineString":
-        return [
-            (dict(feature, geometry=mapping(subgeom)), elapsed)
-            for subgeom in centerline.geoms
-        ]
+@click.group()
+@click.version_option(version=__version__, message="%(version)s")
+def cli():
+    """Extract centerlines of polygons and merge outputs of several runs."""
+
+
+cli.add_command(main, name="extract")
+cli.add_command(merge)
+
+
+if __name__ == "__main__":
+    cli()
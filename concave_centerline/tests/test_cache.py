@@ -0,0 +1,37 @@
+"""
+Test the centerline cache shared by worker processes.
+
+Run from the concave_centerline directory:
+
+    python -m pytest tests
+"""
+
+import pickle
+import sqlite3
+
+from shapely.geometry import box
+
+from label_centerlines import CenterlineCache, get_centerlines
+
+
+def _rows(path):
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM centerlines").fetchone()[0]
+
+
+def test_eviction_during_pooled_run(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = CenterlineCache(path, max_size=1)
+    # more new entries than EVICT_INTERVAL in at least one of the workers
+    geoms = [box(i, 0, i + 0.5, 10) for i in range(3 * CenterlineCache.EVICT_INTERVAL)]
+    results = list(get_centerlines(geoms, workers=2, cache=cache))
+    assert all(result.error is None for result in results)
+    # entries were evicted before the cache is closed
+    assert _rows(path) < len(geoms)
+
+
+def test_unpickled_cache_is_shared(tmp_path):
+    cache = CenterlineCache(tmp_path / "cache.sqlite")
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy is not cache
+    assert pickle.loads(pickle.dumps(cache)) is copy
@@ -0,0 +1,95 @@
+"""
+Compare longest skeleton paths against an all-pairs search with networkx.
+
+Run from the concave_centerline directory:
+
+    python -m pytest tests
+"""
+
+from itertools import combinations
+
+import networkx as nx
+import numpy as np
+import pytest
+from shapely import affinity
+from shapely.geometry import LineString, Point, box
+
+from label_centerlines import CenterlineSkeleton
+
+
+def _all_pairs_longest_paths(graph, nodes, max_paths):
+    """Former implementation searching every pair of nodes."""
+
+    def _paths_distances():
+        for node1, node2 in combinations(nodes, r=2):
+            try:
+                yield nx.single_source_dijkstra(
+                    G=graph, source=node1, target=node2, weight="weight"
+                )
+            except nx.NetworkXNoPath:
+                continue
+
+    return [x for (y, x) in sorted(_paths_distances(), reverse=True)][:max_paths]
+
+
+def _random_corridor(seed):
+    rng = np.random.default_rng(seed)
+    points = np.cumsum(rng.normal(0, 30, (rng.integers(3, 15), 2)), axis=0)
+    return LineString(points).buffer(rng.uniform(3, 10))
+
+
+def _symmetric_corridor(seed):
+    # symmetric outlines produce paths of the same length up to rounding
+    rng = np.random.default_rng(seed)
+    length, width = rng.uniform(50, 300), rng.uniform(3, 12)
+    geom = LineString([(0, 0), (length, 0)]).buffer(
+        width, quad_segs=int(rng.integers(2, 16))
+    )
+    if seed % 2:
+        for position in (0.3, 0.7):
+            geom = geom.difference(Point(length * position, 0).buffer(width / 3))
+    return affinity.rotate(geom, rng.uniform(0, 180))
+
+
+CORRIDORS = (
+    [_random_corridor(seed) for seed in range(10)]
+    + [_symmetric_corridor(seed) for seed in range(20)]
+    + [box(0, 0, 100, 7), box(0, 0, 250, 4)]
+)
+
+
+@pytest.mark.parametrize("geom", CORRIDORS)
+@pytest.mark.parametrize("max_paths", [1, 5])
+def test_longest_paths_match_all_pairs(geom, max_paths):
+    skeleton = CenterlineSkeleton(geom)
+    assert skeleton.graph.longest_paths(
+        skeleton.end_nodes, max_paths
+    ) == _all_pairs_longest_paths(
+        skeleton.graph.to_networkx(), skeleton.end_nodes.tolist(), max_paths
+    )
+
+
+def _all_pairs_longest_paths_between(graph, sources, targets, max_paths):
+    def _paths_distances():
+        for source in sources:
+            for target in targets:
+                try:
+                    yield nx.single_source_dijkstra(
+                        G=graph, source=source, target=target, weight="weight"
+                    )
+                except nx.NetworkXNoPath:
+                    continue
+
+    return [x for (y, x) in sorted(_paths_distances(), reverse=True)][:max_paths]
+
+
+@pytest.mark.parametrize("geom", CORRIDORS[:10])
+@pytest.mark.parametrize("max_paths", [1, 5])
+def test_longest_paths_between_match_all_pairs(geom, max_paths):
+    skeleton = CenterlineSkeleton(geom)
+    sources, targets = skeleton.end_nodes[::2], skeleton.end_nodes[1::2]
+    assert skeleton.graph.longest_paths_between(
+        sources, targets, max_paths
+    ) == _all_pairs_longest_paths_between(
+        skeleton.graph.to_networkx(), sources.tolist(), targets.tolist(), max_paths
+    )
@@ -0,0 +1,36 @@
+"""
+Compare coarse to fine centerlines against the "voronoi" engine.
+
+Run from the concave_centerline directory:
+
+    python -m pytest tests
+"""
+
+import numpy as np
+from shapely.geometry import LineString
+
+from label_centerlines import get_centerline
+
+CORRIDOR = LineString(
+    np.c_[np.linspace(0, 3000, 200), 200 * np.sin(np.linspace(0, 5, 200))]
+).buffer(8)
+
+
+def test_dense_outline_skips_coarse_levels():
+    # the segmentized outline exceeds max_points, so the whole outline is used
+    assert get_centerline(CORRIDOR, engine="coarse_to_fine").equals_exact(
+        get_centerline(CORRIDOR), 0
+    )
+
+
+def test_refined_centerline_within_tolerance():
+    width = 2 * CORRIDOR.area / CORRIDOR.length
+    centerline = get_centerline(CORRIDOR, max_points=100000, engine="coarse_to_fine")
+    voronoi = get_centerline(CORRIDOR, max_points=100000)
+    assert centerline.hausdorff_distance(voronoi) < width / 2
+
+
+def test_coarse_tolerance_exceeded():
+    assert get_centerline(
+        CORRIDOR, max_points=100000, engine="coarse_to_fine", coarse_tolerance=0
+    ).equals_exact(get_centerline(CORRIDOR, max_points=100000), 0)
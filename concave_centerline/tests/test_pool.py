@@ -0,0 +1,56 @@
+"""
+Test replacing workers of the guarded process pool.
+
+Run from the concave_centerline directory:
+
+    python -m pytest tests
+"""
+
+import os
+import time
+
+from label_centerlines._pool import _GuardedPool, _Killed
+
+
+def _square(item):
+    return item * item
+
+
+def _die_on_two(item):
+    if item == 2:
+        os._exit(9)
+    return item * item
+
+
+def _sleep_on_two(item):
+    if item == 2:
+        time.sleep(60)
+    return item * item
+
+
+def test_results():
+    with _GuardedPool(workers=2, timeout=10) as pool:
+        assert pool.submit(_square, [0, 1, 2, 3]).result() == [0, 1, 4, 9]
+
+
+def test_worker_dying_within_chunk():
+    with _GuardedPool(workers=2, timeout=10) as pool:
+        future = pool.submit(_die_on_two, [0, 1, 2, 3])
+        later = pool.submit(_square, [4, 5])
+        results = future.result(timeout=30)
+        assert later.result(timeout=30) == [16, 25]
+    assert results[:2] == [0, 1]
+    assert isinstance(results[2], _Killed)
+    assert results[2].item == 2
+    assert results[2].reason == "died"
+    assert results[3] == 9
+
+
+def test_timeout_within_chunk():
+    with _GuardedPool(workers=1, timeout=0.5, poll=0.05) as pool:
+        results = pool.submit(_sleep_on_two, [0, 1, 2, 3]).result(timeout=30)
+    assert results[:2] == [0, 1]
+    assert isinstance(results[2], _Killed)
+    assert results[2].reason == "timeout"
+    assert results[3] == 9
+    assert pool.killed == 1
@@ -0,0 +1,35 @@
+"""
+Compare tiled centerlines against centerlines of the whole Polygon.
+
+Run from the concave_centerline directory:
+
+    python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+from shapely.geometry import LineString
+
+from label_centerlines import get_centerline
+
+CORRIDORS = [
+    # meanders crossing tiles cut across a straight axis several times
+    LineString([(x, 600 * np.sin(x / 300)) for x in np.linspace(0, 5000, 600)]).buffer(
+        10
+    ),
+    LineString(
+        np.c_[np.linspace(0, 3000, 200), 200 * np.sin(np.linspace(0, 5, 200))]
+    ).buffer(8),
+]
+
+
+@pytest.mark.parametrize("geom", CORRIDORS)
+@pytest.mark.parametrize("tile_length", [500, 1000])
+@pytest.mark.parametrize("max_paths", [1, 5])
+def test_tiled_centerline_follows_corridor(geom, tile_length, max_paths):
+    width = 2 * geom.area / geom.length
+    centerline = get_centerline(geom, tile_length=tile_length, max_paths=max_paths)
+    untiled = get_centerline(geom, max_points=100000, max_paths=1)
+    assert centerline.difference(geom).length < width
+    assert centerline.length == pytest.approx(untiled.length, rel=0.01)
+    assert centerline.simplify(1).hausdorff_distance(untiled.simplify(1)) < width